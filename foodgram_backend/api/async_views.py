@@ -0,0 +1,95 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+
+from .filters import IngredientFilter
+from .search import ingredient_index
+from .views import IngredientViewSet, TagViewSet
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    """Ответ в том же виде, что отдает JSONRenderer DRF."""
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type='application/json',
+        status=status_code,
+    )
+
+
+def read_only(view):
+    """Только GET/HEAD; 404 и 405 в формате ошибок DRF."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return json_response(
+                {'detail': str(exceptions.MethodNotAllowed(
+                    request.method
+                ).detail)},
+                status.HTTP_405_METHOD_NOT_ALLOWED,
+            )
+        try:
+            return await view(request, *args, **kwargs)
+        except Http404:
+            return json_response(
+                {'detail': str(exceptions.NotFound.default_detail)},
+                status.HTTP_404_NOT_FOUND,
+            )
+    return wrapper
+
+
+def reference_list(viewset):
+    """Данные list справочника из кэша вьюсета."""
+    def render():
+        return viewset.serializer_class(
+            viewset.queryset.all(), many=True
+        ).data
+    return viewset.reference_cache.get_or_set(('list',), render)
+
+
+def reference_detail(viewset, pk):
+    """Данные retrieve справочника из кэша вьюсета."""
+    def render():
+        return viewset.serializer_class(
+            get_object_or_404(viewset.queryset, pk=pk)
+        ).data
+    return viewset.reference_cache.get_or_set(('detail', pk), render)
+
+
+@read_only
+async def tag_list(request):
+    return json_response(await sync_to_async(reference_list)(TagViewSet))
+
+
+@read_only
+async def tag_detail(request, pk):
+    return json_response(
+        await sync_to_async(reference_detail)(TagViewSet, str(pk))
+    )
+
+
+@read_only
+async def ingredient_list(request):
+    name = request.GET.get(IngredientFilter.search_param)
+    if not name:
+        return json_response(
+            await sync_to_async(reference_list)(IngredientViewSet)
+        )
+    limit = request.GET.get('limit', '')
+    return json_response(await sync_to_async(ingredient_index.search)(
+        name,
+        limit=(int(limit) if limit.isdigit()
+               else settings.INGREDIENT_SEARCH_LIMIT),
+        fuzzy=request.GET.get('fuzzy') in ('1', 'true'),
+    ))
+
+
+@read_only
+async def ingredient_detail(request, pk):
+    return json_response(
+        await sync_to_async(reference_detail)(IngredientViewSet, str(pk))
+    )
@@ -0,0 +1,92 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram_backend.replicas import read_from_primary
+from recipes.cache import get_version
+from users.signals import AUTH_VERSION
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication с LRU-кэшем токен -> пользователь в памяти
+    процесса. Запись живет AUTH_TOKEN_CACHE_TTL секунд и сбрасывается
+    во всех процессах при смене общей версии пользователя: выход,
+    смена пароля, деактивация или любое сохранение пользователя.
+    Снимок из кэша получают только безопасные запросы: изменяющие
+    читают пользователя заново, чтобы не сохранить устаревшие данные
+    поверх чужих изменений.
+    """
+
+    _lock = threading.Lock()
+    _entries = OrderedDict()
+    # Токен -> id пользователя: связь не меняется, по ней версия
+    # читается до пользователя.
+    _user_ids = OrderedDict()
+
+    def authenticate(self, request):
+        self.cached_user_allowed = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        if getattr(self, 'cached_user_allowed', False):
+            entry = self._get(key)
+            if entry is not None:
+                user, token, _ = entry
+                # Копия: изменения request.user не попадут в кэш.
+                return copy.copy(user), token
+        with self._lock:
+            user_id = self._user_ids.get(key)
+        # Версия читается до пользователя: если данные сменятся
+        # между чтениями, запись попадет в кэш со старой версией
+        # и не пройдет проверку в _get. Для нового токена версию
+        # прочитать заранее нельзя, он кэшируется со следующего раза.
+        version = (
+            None if user_id is None
+            else get_version(AUTH_VERSION.format(user_id))
+        )
+        # Токен могли только что выдать: реплика может его не знать.
+        with read_from_primary():
+            user, token = super().authenticate_credentials(key)
+        if user_id == user.pk:
+            self._set(key, (copy.copy(user), token, version))
+        self._remember(key, user.pk)
+        return user, token
+
+    def _get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        user, _, version = value
+        if get_version(AUTH_VERSION.format(user.pk)) != version:
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        return value
+
+    def _remember(self, key, user_id):
+        with self._lock:
+            self._user_ids[key] = user_id
+            self._user_ids.move_to_end(key)
+            while len(self._user_ids) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._user_ids.popitem(last=False)
+
+    def _set(self, key, value):
+        expires = time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
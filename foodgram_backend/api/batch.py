@@ -0,0 +1,155 @@
+from django.db import connections, router, transaction
+from django.db.models import F, Sum
+
+from recipes.models import (IngredientRecipe, Recipe, ShoppingListIngredient,
+                            TimelineEntry)
+from recipes.signals import unfollow
+from users.models import User
+
+CREATED = 'created'
+EXISTS = 'exists'
+DELETED = 'deleted'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+FORBIDDEN = 'forbidden'
+
+
+def insert_links(model, user, field, ids):
+    """
+    INSERT ... ON CONFLICT DO NOTHING RETURNING: возвращает id целей,
+    связи с которыми созданы этим запросом, а не параллельным.
+    """
+    connection = connections[router.db_for_write(model)]
+    columns = [
+        column for column in model._meta.concrete_fields
+        if not column.primary_key
+    ]
+    rows = []
+    for pk in ids:
+        obj = model(user=user, **{f'{field}_id': pk})
+        rows.append([
+            column.get_db_prep_save(column.pre_save(obj, True), connection)
+            for column in columns
+        ])
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {0} ({1}) VALUES {2} '
+            'ON CONFLICT DO NOTHING RETURNING {3}'.format(
+                quote(model._meta.db_table),
+                ', '.join(quote(column.column) for column in columns),
+                ', '.join(
+                    ['({0})'.format(', '.join(['%s'] * len(columns)))]
+                    * len(rows)
+                ),
+                quote(model._meta.get_field(field).column),
+            ),
+            [value for row in rows for value in row],
+        )
+        return {pk for pk, in cursor.fetchall()}
+
+
+def delete_links(model, user, field, ids):
+    """
+    DELETE ... RETURNING без выборки записей и сигналов: возвращает id
+    целей, связи с которыми удалены этим запросом.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM {0} WHERE {1} = %s AND {2} IN ({3}) '
+            'RETURNING {2}'.format(
+                quote(model._meta.db_table),
+                quote(model._meta.get_field('user').column),
+                quote(model._meta.get_field(field).column),
+                ', '.join(['%s'] * len(ids)),
+            ),
+            [user.pk, *ids],
+        )
+        return {pk for pk, in cursor.fetchall()}
+
+
+@transaction.atomic
+def apply_batch(user, model, field, targets, add, remove, on_change,
+                forbidden=()):
+    """
+    Добавление и удаление связей user -> target пачкой:
+    одна проверка целей, один INSERT и один DELETE. Сигналы модели
+    при этом не отправляются, поэтому счетчики обновляет
+    on_change(user, ids, delta) — только для связей, которые
+    действительно вставлены или удалены, так что параллельные
+    запросы не учитываются дважды.
+    Возвращает результат для каждого id.
+    """
+    found = set(targets.filter(
+        pk__in=set(add) | set(remove)
+    ).values_list('pk', flat=True))
+    to_create = {pk for pk in add if pk in found and pk not in forbidden}
+    created = (
+        insert_links(model, user, field, to_create) if to_create else set()
+    )
+    to_delete = {pk for pk in remove if pk in found}
+    deleted = (
+        delete_links(model, user, field, to_delete) if to_delete else set()
+    )
+    results = []
+    reported = set()
+    for pk in add:
+        if pk not in found:
+            result = NOT_FOUND
+        elif pk in forbidden:
+            result = FORBIDDEN
+        elif pk in created and pk not in reported:
+            result = CREATED
+        else:
+            result = EXISTS
+        reported.add(pk)
+        results.append({'id': pk, 'action': 'add', 'result': result})
+    for pk in remove:
+        if pk not in found:
+            result = NOT_FOUND
+        elif pk in deleted and pk not in reported:
+            result = DELETED
+        else:
+            result = ABSENT
+        reported.add(pk)
+        results.append({'id': pk, 'action': 'remove', 'result': result})
+    if created:
+        on_change(user, created, 1)
+    if deleted:
+        on_change(user, deleted, -1)
+    return results
+
+
+def favorites_changed(user, recipe_ids, delta):
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        favorites_count=F('favorites_count') + delta
+    )
+
+
+def carts_changed(user, recipe_ids, delta):
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        in_carts_count=F('in_carts_count') + delta
+    )
+    amounts = dict(
+        IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id').annotate(
+            total=Sum('amount')
+        ).order_by()
+    )
+    if delta > 0:
+        ShoppingListIngredient.objects.add_amounts(user.id, amounts)
+    else:
+        ShoppingListIngredient.objects.subtract_amounts(user.id, amounts)
+
+
+def follows_changed(user, author_ids, delta):
+    User.objects.filter(pk__in=author_ids).update(
+        followers_count=F('followers_count') + delta
+    )
+    if delta > 0:
+        TimelineEntry.objects.backfill(user.id, author_ids)
+    else:
+        unfollow(user.id, author_ids)
@@ -0,0 +1,126 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+
+from foodgram_backend.replicas import read_from_primary
+from recipes.cache import get_version
+from recipes.models import Recipe
+
+
+class RecipePageCache:
+    """
+    Кэш готовых страниц списка рецептов для анонимных пользователей.
+    Ключ — нормализованные параметры запроса и поколение 'recipes',
+    которое меняется при любом изменении рецептов.
+    """
+
+    prefix = 'recipe-page'
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.cache = caches['shared']
+
+    def key(self, request):
+        params = urlencode(sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+        ))
+        raw = '{0}://{1}{2}?{3}'.format(
+            request.scheme, request.get_host(), request.path, params
+        )
+        return '{0}:{1}:{2}'.format(
+            self.prefix,
+            get_version('recipes'),
+            hashlib.md5(raw.encode()).hexdigest(),
+        )
+
+    def _count(self, name):
+        key = '{0}:{1}'.format(self.prefix, name)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, None)
+
+    def get(self, key):
+        data = self.cache.get(key)
+        self._count('misses' if data is None else 'hits')
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, self.timeout)
+
+    def stats(self):
+        stats = self.cache.get_many(
+            ['{0}:hits'.format(self.prefix), '{0}:misses'.format(self.prefix)]
+        )
+        return {
+            name: stats.get('{0}:{1}'.format(self.prefix, name), 0)
+            for name in ('hits', 'misses')
+        }
+
+
+recipe_page_cache = RecipePageCache(settings.RECIPE_PAGE_CACHE_TIMEOUT)
+
+
+class RecipeFragmentCache:
+    """
+    Кэш сериализованных рецептов без признаков пользователя.
+    Ключ — id и версия рецепта (Recipe.version), поколения тегов
+    и ингредиентов и адрес сайта (в данных абсолютные ссылки на фото):
+    правка рецепта сбрасывает только его фрагмент. Страница читается
+    одним get_many.
+    """
+
+    prefix = 'recipe-fragment'
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.cache = caches['shared']
+
+    def get_many(self, instances, request, render):
+        """Фрагменты {id: данные}; отсутствующие в кэше рецепты
+        загружаются одним запросом и сериализуются render. Рецептов,
+        удаленных после выборки instances, в результате нет."""
+        site = request.build_absolute_uri('/') if request else ''
+        namespace = '{0}:{1}:{2}:{3}'.format(
+            self.prefix,
+            get_version('tags'),
+            get_version('ingredients'),
+            hashlib.md5(site.encode()).hexdigest()[:8],
+        )
+        keys = {
+            instance.pk: '{0}:{1}:{2}'.format(
+                namespace, instance.pk, instance.version
+            )
+            for instance in instances
+        }
+        cached = self.cache.get_many(list(keys.values()))
+        fragments = {
+            pk: cached[key] for pk, key in keys.items() if key in cached
+        }
+        missing = [pk for pk in keys if pk not in fragments]
+        if missing:
+            with read_from_primary():
+                recipes = Recipe.objects.with_related().in_bulk(missing)
+                rendered = {
+                    pk: render(recipe) for pk, recipe in recipes.items()
+                }
+            # Рецепт мог измениться после выборки instances: фрагмент
+            # сохраняется под версией, с которой он прочитан.
+            self.cache.set_many(
+                {
+                    '{0}:{1}:{2}'.format(
+                        namespace, pk, recipes[pk].version
+                    ): data
+                    for pk, data in rendered.items()
+                },
+                self.timeout,
+            )
+            fragments.update(rendered)
+        return fragments
+
+
+recipe_fragments = RecipeFragmentCache(settings.RECIPE_FRAGMENT_CACHE_TIMEOUT)
@@ -0,0 +1,65 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+
+from recipes.models import Recipe, TimelineEntry
+from users.models import Follow
+from .pagination import CustomPagination
+
+
+def feed_keys(user, after, size):
+    """
+    Ключи (pub_date, id) следующих size + 1 рецептов ленты: слияние
+    готовой ленты пользователя с рецептами авторов, которые читаются
+    при запросе. Оба источника выбираются по индексу с курсором.
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    pulled = Recipe.objects.filter(author__in=Follow.objects.filter(
+        user=user,
+        author__followers_count__gte=settings.FEED_PULL_FOLLOWERS,
+    ).values('author_id'))
+    if after is not None:
+        pub_date, pk = after
+        entries = entries.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, recipe_id__lt=pk)
+        )
+        pulled = pulled.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+        )
+    entries = entries.order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id'
+    )[:size + 1]
+    pulled = pulled.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id'
+    )[:size + 1]
+    seen = set()
+    keys = []
+    for key in heapq.merge(entries, pulled, reverse=True):
+        # Рецепт автора, недавно набравшего подписчиков, может быть
+        # в обоих источниках.
+        if key[1] not in seen:
+            seen.add(key[1])
+            keys.append(key)
+    return list(islice(keys, size + 1))
+
+
+class FeedPagination(CustomPagination):
+    """Пагинация ленты подписок: всегда по курсору (pub_date, id)."""
+
+    cursor_ordering = ('-pub_date', '-id')
+
+    def paginate_feed(self, queryset, request, user):
+        self.cursor_mode = True
+        self.request = request
+        self.ordering = self.cursor_ordering
+        size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        after = self.cursor_values(Recipe, cursor) if cursor else None
+        keys = feed_keys(user, after, size)
+        self.has_next = len(keys) > size
+        ids = [pk for _, pk in keys[:size]]
+        recipes = queryset.in_bulk(ids)
+        self.page = [recipes[pk] for pk in ids if pk in recipes]
+        return self.page
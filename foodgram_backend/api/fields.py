@@ -2,6 +2,7 @@ import base64
 
 from rest_framework import serializers
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 
 
 class Base64ImageField(serializers.ImageField):
@@ -13,3 +14,17 @@ class Base64ImageField(serializers.ImageField):
             data = ContentFile(base64.b64decode(img), name='temp.' + ext)
 
         return super().to_internal_value(data)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные WebP-копии фото рецепта."""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for variant, path in value.get('paths', {}).items():
+            url = default_storage.url(path)
+            urls[variant] = (
+                request.build_absolute_uri(url) if request else url
+            )
+        return urls
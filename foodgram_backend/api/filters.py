@@ -1,20 +1,55 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef, Q,
+                              Value, When)
 from django_filters import rest_framework as filters
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe
+from recipes.cache import VersionedLRUCache
+from recipes.models import Recipe, Tag
+
+tag_cache = VersionedLRUCache('tags', maxsize=1)
+
+
+def tag_map():
+    """Соответствие slug -> id всех тэгов, из кэша процесса."""
+    return tag_cache.get_or_set(
+        'slugs', lambda: dict(Tag.objects.values_list('slug', 'id'))
+    )
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_map()]
 
 
 class RecipeFilter(filters.FilterSet):
 
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method='get_tags'
+    )
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
+
+    def get_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тэгов. EXISTS вместо JOIN
+        не размножает строки, поэтому COUNT и страницы верны.
+        """
+        if not value:
+            return queryset
+        slugs = tag_map()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=[slugs[slug] for slug in value],
+        )))
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -26,6 +61,37 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        """
+        Полнотекстовый поиск по названию и описанию с сортировкой
+        по релевантности. На PostgreSQL — по search_vector (GIN-индекс,
+        русская морфология), на других базах — LIKE по каждому слову.
+        """
+        value = value.strip()
+        if not value:
+            return queryset
+        if connections[queryset.db].vendor == 'postgresql':
+            query = SearchQuery(
+                value, config='russian', search_type='websearch'
+            )
+            return queryset.filter(search_vector=query).annotate(
+                rank=SearchRank(F('search_vector'), query)
+            ).order_by('-rank', '-pub_date', '-id')
+        words = value.split()
+        for word in words:
+            queryset = queryset.filter(
+                Q(name__icontains=word) | Q(text__icontains=word)
+            )
+        return queryset.annotate(
+            rank=Case(
+                When(name__icontains=value, then=Value(2)),
+                When(Q(*[Q(name__icontains=word) for word in words]),
+                     then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        ).order_by('-rank', '-pub_date', '-id')
+
 
 class IngredientFilter(SearchFilter):
     search_param = 'name'
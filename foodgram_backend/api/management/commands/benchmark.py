@@ -0,0 +1,222 @@
+import json
+import math
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from api.middleware import QueryRecorder, record_queries
+from recipes.models import Ingredient, Recipe, ShoppingCart, Tag
+
+
+def percentile(values, percent):
+    """Процентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет основные эндпоинты через тестовый клиент и выводит '
+            'p50/p95/p99 времени ответа и число SQL-запросов. '
+            'Результат можно сохранить как базовый и сравнивать с ним.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--only', nargs='*', default=None,
+            help='Запустить только перечисленные сценарии.'
+        )
+        parser.add_argument(
+            '--save-baseline', metavar='PATH',
+            help='Сохранить результаты в JSON.'
+        )
+        parser.add_argument(
+            '--baseline', metavar='PATH',
+            help='Сравнить с сохраненными результатами.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95, доля (по умолчанию 0.2).'
+        )
+
+    def handle(self, *args, **options):
+        scenarios = self.scenarios()
+        if options['only']:
+            unknown = set(options['only']) - scenarios.keys()
+            if unknown:
+                raise CommandError('Неизвестные сценарии: {0}'.format(
+                    ', '.join(sorted(unknown))
+                ))
+            scenarios = {
+                name: scenario for name, scenario in scenarios.items()
+                if name in options['only']
+            }
+        results = {}
+        # Откат транзакции в recipe_create не удаляет сохраненные фото:
+        # они пишутся во временный MEDIA_ROOT.
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            ALLOWED_HOSTS=['testserver'], MEDIA_ROOT=media_root,
+        ):
+            for name, (request, rollback) in scenarios.items():
+                results[name] = self.measure(
+                    request, rollback,
+                    options['iterations'], options['warmup'],
+                )
+        self.report(results)
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def scenarios(self):
+        """Сценарии: имя -> (функция запроса, откатывать ли изменения).
+        Данные берутся из базы: нужен набор, созданный generatedata."""
+        cart = ShoppingCart.objects.select_related('user').first()
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        if cart is None or recipe is None:
+            raise CommandError(
+                'Нет данных: сначала выполните manage.py generatedata.'
+            )
+        user = cart.user
+        token, _ = Token.objects.get_or_create(user=user)
+        anonymous = Client()
+        client = Client(HTTP_AUTHORIZATION='Token {0}'.format(token.key))
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        tags_query = '&'.join('tags={0}'.format(slug) for slug in tags)
+        ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)[:5]
+        )
+        ingredient = Ingredient.objects.order_by('id').first()
+        new_recipe = {
+            'name': 'benchmark',
+            'text': 'benchmark',
+            'cooking_time': 10,
+            'tags': list(Tag.objects.values_list('id', flat=True)[:1]),
+            'ingredients': [
+                {'id': pk, 'amount': 10} for pk in ingredients
+            ],
+            'image': (
+                'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAg'
+                'MAAABieywaAAAACVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAA'
+                'OxAGVKw4bAAAACklEQVQImWNoAAAAggCByxOyYQAAAABJRU5ErkJggg=='
+            ),
+        }
+        return {
+            'recipes_list_anonymous': (
+                lambda: anonymous.get('/api/recipes/'), False),
+            'recipes_list': (
+                lambda: client.get('/api/recipes/'), False),
+            'recipes_list_cursor': (
+                lambda: client.get('/api/recipes/?cursor='), False),
+            'recipe_detail': (
+                lambda: client.get('/api/recipes/{0}/'.format(recipe.id)),
+                False),
+            'recipes_filter_tags': (
+                lambda: client.get('/api/recipes/?' + tags_query), False),
+            'recipes_filter_favorited': (
+                lambda: client.get('/api/recipes/?is_favorited=1'), False),
+            'subscriptions': (
+                lambda: client.get(
+                    '/api/users/subscriptions/?recipes_limit=3'), False),
+            'ingredients_search': (
+                lambda: client.get('/api/ingredients/?name={0}'.format(
+                    ingredient.name[:3])), False),
+            'recipe_create': (
+                lambda: client.post(
+                    '/api/recipes/', new_recipe,
+                    content_type='application/json'), True),
+            'download_shopping_cart': (
+                lambda: client.get('/api/recipes/download_shopping_cart/'),
+                False),
+        }
+
+    def measure(self, request, rollback, iterations, warmup):
+        timings = []
+        queries = []
+        for iteration in range(warmup + iterations):
+            recorder = QueryRecorder()
+            start = time.perf_counter()
+            with record_queries(recorder):
+                status = self.call(request, rollback)
+            elapsed = time.perf_counter() - start
+            if status >= 400:
+                raise CommandError('Ответ {0}.'.format(status))
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(recorder.count)
+        return {
+            'p50': round(percentile(timings, 50), 2),
+            'p95': round(percentile(timings, 95), 2),
+            'p99': round(percentile(timings, 99), 2),
+            'queries': int(statistics.median(queries)),
+            'queries_max': max(queries),
+        }
+
+    @staticmethod
+    def call(request, rollback):
+        """Запрос с полным чтением тела ответа. Изменяющие запросы
+        выполняются в транзакции, которая откатывается."""
+        if not rollback:
+            response = request()
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response.status_code
+        try:
+            with transaction.atomic():
+                status = request().status_code
+                raise Rollback
+        except Rollback:
+            return status
+
+    def report(self, results):
+        self.stdout.write('{0:<28}{1:>10}{2:>10}{3:>10}{4:>9}{5:>6}'.format(
+            'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'max'
+        ))
+        for name, result in results.items():
+            self.stdout.write(
+                '{0:<28}{p50:>10}{p95:>10}{p99:>10}'
+                '{queries:>9}{queries_max:>6}'.format(name, **result)
+            )
+
+    def compare(self, results, path, tolerance):
+        try:
+            with open(path) as file:
+                baseline = json.load(file)
+        except (OSError, ValueError) as error:
+            raise CommandError('Не удалось прочитать {0}: {1}'.format(
+                path, error
+            ))
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append('{0}: запросов {1} > {2}'.format(
+                    name, result['queries'], base['queries']
+                ))
+            if result['p95'] > base['p95'] * (1 + tolerance):
+                regressions.append('{0}: p95 {1} мс > {2} мс'.format(
+                    name, result['p95'], base['p95']
+                ))
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно {0}:\n{1}'.format(
+                    path, '\n'.join(regressions)
+                )
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Регрессий относительно {0} нет.'.format(path)
+        ))
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from .benchmark import percentile
+
+MODES = ('wsgi', 'asgi')
+
+
+async def fetch(host, port, path, timeout):
+    """GET с Connection: close; статус ответа или None при ошибке."""
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout
+        )
+    except (OSError, asyncio.TimeoutError):
+        return None
+    try:
+        writer.write(
+            'GET {0} HTTP/1.1\r\nHost: {1}\r\nConnection: close\r\n\r\n'
+            .format(path, host).encode()
+        )
+        response = await asyncio.wait_for(reader.read(), timeout)
+        return int(response.split(b' ', 2)[1])
+    except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+        return None
+    finally:
+        writer.close()
+
+
+async def slow_upload(host, port, path, size, seconds, stop):
+    """Медленный клиент: тело POST приходит по байту в течение seconds."""
+    while not stop.is_set():
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        try:
+            writer.write(
+                'POST {0} HTTP/1.1\r\nHost: {1}\r\n'
+                'Content-Type: application/json\r\n'
+                'Content-Length: {2}\r\nConnection: close\r\n\r\n'
+                .format(path, host, size).encode()
+            )
+            for _ in range(size):
+                if stop.is_set():
+                    break
+                writer.write(b' ')
+                await writer.drain()
+                await asyncio.sleep(seconds / size)
+            await reader.read()
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает режимы WSGI и ASGI под нагрузкой медленных '
+            'клиентов: запускает gunicorn в каждом режиме, держит открытыми '
+            'медленные загрузки и замеряет время ответа обычных запросов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=MODES,
+                            default=list(MODES))
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--slow-clients', type=int, default=8,
+            help='Число одновременных медленных загрузок.'
+        )
+        parser.add_argument(
+            '--slow-seconds', type=float, default=5.0,
+            help='За сколько секунд медленный клиент отправляет тело.'
+        )
+        parser.add_argument('--slow-path', default='/api/auth/token/login/')
+        parser.add_argument('--path', default='/api/tags/')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument(
+            '--timeout', type=float, default=30.0,
+            help='Тайм-аут одного запроса, секунд.'
+        )
+
+    def handle(self, *args, **options):
+        if options['slow_seconds'] <= 0 or options['requests'] < 1:
+            raise CommandError(
+                '--slow-seconds и --requests должны быть больше 0.'
+            )
+        self.stdout.write(
+            '{0} медленных клиентов по {1:.0f} с, {2} запросов {3} '
+            'с параллельностью {4}, воркеров {5}'.format(
+                options['slow_clients'], options['slow_seconds'],
+                options['requests'], options['path'],
+                options['concurrency'], options['workers'],
+            )
+        )
+        self.stdout.write('{0:<6}{1:>10}{2:>10}{3:>10}{4:>8}{5:>8}'.format(
+            'mode', 'p50 ms', 'p95 ms', 'max ms', 'ok', 'fail'
+        ))
+        for mode in options['modes']:
+            server = self.start_server(mode, options)
+            try:
+                result = asyncio.run(self.measure(options))
+            finally:
+                server.terminate()
+                server.wait()
+            self.report(mode, *result)
+
+    def start_server(self, mode, options):
+        server = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn',
+                '--config',
+                os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'),
+                '--bind', '127.0.0.1:{0}'.format(options['port']),
+                '--workers', str(options['workers']),
+                '--log-level', 'warning',
+            ],
+            cwd=settings.BASE_DIR,
+            env=dict(os.environ, SERVER_MODE=mode),
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(
+                    'gunicorn в режиме {0} завершился с кодом {1}.'.format(
+                        mode, server.returncode
+                    )
+                )
+            try:
+                socket.create_connection(
+                    ('127.0.0.1', options['port']), timeout=1
+                ).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('gunicorn не начал принимать соединения.')
+
+    async def measure(self, options):
+        host, port = '127.0.0.1', options['port']
+        # Прогрев: справочники и индекс попадают в кэш воркеров.
+        for _ in range(options['workers'] * 2):
+            await fetch(host, port, options['path'], options['timeout'])
+        stop = asyncio.Event()
+        slow = [
+            asyncio.ensure_future(slow_upload(
+                host, port, options['slow_path'], 200,
+                options['slow_seconds'], stop,
+            ))
+            for _ in range(options['slow_clients'])
+        ]
+        await asyncio.sleep(0.5)
+        timings, failures = [], 0
+        queue = asyncio.Queue()
+        for _ in range(options['requests']):
+            queue.put_nowait(None)
+
+        async def client():
+            nonlocal failures
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                code = await fetch(
+                    host, port, options['path'], options['timeout']
+                )
+                if code == 200:
+                    timings.append((time.perf_counter() - start) * 1000)
+                else:
+                    failures += 1
+
+        await asyncio.gather(
+            *(client() for _ in range(options['concurrency']))
+        )
+        stop.set()
+        for task in slow:
+            task.cancel()
+        await asyncio.gather(*slow, return_exceptions=True)
+        return timings, failures
+
+    def report(self, mode, timings, failures):
+        if not timings:
+            self.stdout.write('{0:<6}{1:>30}{2:>8}{3:>8}'.format(
+                mode, '-', 0, failures
+            ))
+            return
+        self.stdout.write(
+            '{0:<6}{1:>10.1f}{2:>10.1f}{3:>10.1f}{4:>8}{5:>8}'.format(
+                mode, percentile(timings, 50), percentile(timings, 95),
+                max(timings), len(timings), failures,
+            )
+        )
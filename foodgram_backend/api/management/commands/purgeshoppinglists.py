@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.tasks import purge_shopping_lists
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы списков покупок, сформированные фоновыми '
+            'задачами, старше заданного срока. Запускается по расписанию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int,
+            default=settings.SHOPPING_LIST_FILE_TTL,
+            help='Возраст файла в секундах.'
+        )
+
+    def handle(self, *args, **options):
+        removed = purge_shopping_lists(options['older_than'])
+        self.stdout.write(self.style.SUCCESS(
+            'done: удалено файлов {0}.'.format(removed)
+        ))
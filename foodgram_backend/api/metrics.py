@@ -0,0 +1,188 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LABELS = ('view', 'action', 'method')
+COUNTERS = (
+    ('db_queries', 'foodgram_request_db_queries_total',
+     'SQL-запросы, выполненные при обработке запросов.'),
+    ('db_seconds', 'foodgram_request_db_seconds_total',
+     'Время выполнения SQL-запросов, секунды.'),
+    ('serialize_seconds', 'foodgram_request_serialize_seconds_total',
+     'Время сериализации ответов (serializer.data), секунды.'),
+    ('render_seconds', 'foodgram_request_render_seconds_total',
+     'Время рендеринга готовых данных в JSON, CSV и т.п., секунды.'),
+)
+HISTOGRAM = ('foodgram_request_duration_seconds',
+             'Полное время обработки запроса, секунды.')
+
+
+def empty_series():
+    return {
+        'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0,
+        'db_queries': 0, 'db_seconds': 0.0, 'serialize_seconds': 0.0,
+        'render_seconds': 0.0,
+    }
+
+
+class MetricsRegistry:
+    """
+    Метрики запросов процесса. Каждый воркер gunicorn периодически
+    перезаписывает свой снимок METRICS_DIR/<pid>.json, /api/_metrics
+    суммирует снимки всех воркеров. Снимки завершившихся процессов
+    и не обновлявшиеся дольше METRICS_SNAPSHOT_TTL удаляются при сборе.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._path = None
+        self._flushed = 0
+        self._series = {}
+
+    def _check_pid(self):
+        # После fork счетчики родителя не должны попасть в снимок
+        # дочернего процесса.
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._series = {}
+            self._path = None
+            if settings.METRICS_DIR:
+                self._path = os.path.join(
+                    settings.METRICS_DIR, '{0}.json'.format(pid)
+                )
+
+    def observe(self, labels, duration, db_queries, db_seconds,
+                serialize_seconds, render_seconds):
+        with self._lock:
+            self._check_pid()
+            series = self._series.setdefault(labels, empty_series())
+            for position, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    series['buckets'][position] += 1
+            series['count'] += 1
+            series['sum'] += duration
+            series['db_queries'] += db_queries
+            series['db_seconds'] += db_seconds
+            series['serialize_seconds'] += serialize_seconds
+            series['render_seconds'] += render_seconds
+        if time.monotonic() - self._flushed >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._check_pid()
+            self._flushed = time.monotonic()
+            if self._path is None:
+                return
+            snapshot = [
+                [list(labels), series]
+                for labels, series in self._series.items()
+            ]
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=settings.METRICS_DIR)
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(temporary, self._path)
+
+    def collect(self):
+        """Сумма снимков всех процессов."""
+        self.flush()
+        if self._path is None:
+            with self._lock:
+                return {
+                    labels: json.loads(json.dumps(series))
+                    for labels, series in self._series.items()
+                }
+        total = defaultdict(empty_series)
+        deadline = time.time() - settings.METRICS_SNAPSHOT_TTL
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            if path != self._path and is_stale(path, deadline):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for labels, series in snapshot:
+                merged = total[tuple(labels)]
+                for key, value in series.items():
+                    if key == 'buckets':
+                        merged[key] = [
+                            left + right
+                            for left, right in zip(merged[key], value)
+                        ]
+                    else:
+                        merged[key] += value
+        return dict(total)
+
+    def exposition(self):
+        """Метрики в текстовом формате Prometheus."""
+        series = sorted(self.collect().items())
+        lines = [
+            '# HELP {0} {1}'.format(*HISTOGRAM),
+            '# TYPE {0} histogram'.format(HISTOGRAM[0]),
+        ]
+        for labels, values in series:
+            for bound, count in zip(BUCKETS, values['buckets']):
+                lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(
+                    HISTOGRAM[0], format_labels(labels), bound, count
+                ))
+            lines.append('{0}_bucket{{{1},le="+Inf"}} {2}'.format(
+                HISTOGRAM[0], format_labels(labels), values['count']
+            ))
+            lines.append('{0}_sum{{{1}}} {2}'.format(
+                HISTOGRAM[0], format_labels(labels), values['sum']
+            ))
+            lines.append('{0}_count{{{1}}} {2}'.format(
+                HISTOGRAM[0], format_labels(labels), values['count']
+            ))
+        for key, name, description in COUNTERS:
+            lines.append('# HELP {0} {1}'.format(name, description))
+            lines.append('# TYPE {0} counter'.format(name))
+            for labels, values in series:
+                lines.append('{0}{{{1}}} {2}'.format(
+                    name, format_labels(labels), values[key]
+                ))
+        return '\n'.join(lines) + '\n'
+
+
+def is_stale(path, deadline):
+    """Снимок завершившегося процесса, старше deadline или с именем
+    не в формате <pid>.json."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if not name.isdigit():
+        return True
+    try:
+        if os.path.getmtime(path) < deadline:
+            return True
+        os.kill(int(name), 0)
+    except (ProcessLookupError, FileNotFoundError):
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def format_labels(labels):
+    return ','.join(
+        '{0}="{1}"'.format(
+            name, value.replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for name, value in zip(LABELS, labels)
+    )
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.functional import SimpleLazyObject, empty
+
+from .metrics import metrics
+
+current_recorders = ContextVar('current_recorders', default=())
+
+
+class QueryRecorder:
+    """Обертка execute_wrapper: число и суммарное время SQL-запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def dispatch_query(execute, sql, params, many, context):
+    for recorder in current_recorders.get():
+        execute = partial(recorder, execute)
+    return execute(sql, params, many, context)
+
+
+def install_dispatcher(connection, **kwargs):
+    if dispatch_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(dispatch_query)
+
+
+connection_created.connect(install_dispatcher)
+
+
+@contextmanager
+def record_queries(recorder):
+    """
+    Запросы текущего контекста пишутся в recorder и во все внешние.
+    Получатели берутся из ContextVar: соединения в Django привязаны к потоку,
+    а sync_to_async переносит контекст в поток, где выполняется ORM.
+    """
+    for connection in connections.all():
+        install_dispatcher(connection)
+    token = current_recorders.set(current_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        current_recorders.reset(token)
+
+
+@contextmanager
+def serialization_timer(request):
+    """Время блока добавляется к serialize_seconds запроса."""
+    request = getattr(request, '_request', request)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if hasattr(request, 'serialize_seconds'):
+            request.serialize_seconds += time.perf_counter() - start
+
+
+def serialized(serializer):
+    """serializer.data с замером времени сериализации: данные
+    вычисляются в представлении, до рендеринга ответа."""
+    with serialization_timer(serializer.context.get('request')):
+        return serializer.data
+
+
+class ServerTimingMiddleware:
+    """
+    Замеры запроса: число и время SQL, время сериализации (см.
+    serialized), время рендеринга и полное время.
+    Метрики копятся с метками view/action/method, сотрудникам
+    они также отдаются заголовком Server-Timing.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Как в MiddlewareMixin: экземпляр помечается
+            # корутинной функцией для внешних обработчиков.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        start = self.start(request)
+        recorder = QueryRecorder()
+        with record_queries(recorder):
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        start = self.start(request)
+        recorder = QueryRecorder()
+        with record_queries(recorder):
+            response = await self.get_response(request)
+        return self.finish(request, response, recorder, start)
+
+    @staticmethod
+    def start(request):
+        request.serialize_seconds = 0.0
+        request.render_seconds = 0.0
+        return time.perf_counter()
+
+    def finish(self, request, response, recorder, start):
+        request.metrics_labels = self.labels(request)
+        if response.streaming:
+            # Запросы потокового ответа выполняются при его отдаче.
+            response.streaming_content = self.stream(
+                response.streaming_content, request, recorder, start
+            )
+        else:
+            self.observe(request, recorder, start)
+        user = self.resolved_user(request)
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = (
+                'db;dur={0:.1f};desc="{1} queries", serialize;dur={2:.1f}, '
+                'render;dur={3:.1f}, total;dur={4:.1f}'.format(
+                    recorder.seconds * 1000, recorder.count,
+                    request.serialize_seconds * 1000,
+                    request.render_seconds * 1000,
+                    (time.perf_counter() - start) * 1000,
+                )
+            )
+        return response
+
+    @staticmethod
+    def labels(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return ('', 'unmatched', request.method)
+        view = getattr(match.func, 'cls', None)
+        actions = getattr(match.func, 'actions', None) or {}
+        method = request.method.lower()
+        return (
+            view.__name__ if view else match.func.__name__,
+            actions.get(method, method),
+            request.method,
+        )
+
+    @staticmethod
+    def resolved_user(request):
+        """Пользователь запроса, если он уже известен. Ленивый
+        request.user из сессии здесь не вычисляется: в асинхронном
+        режиме это был бы запрос к базе из цикла событий."""
+        user = getattr(request, 'user', None)
+        if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+            return None
+        return user
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.render_seconds = time.perf_counter() - started
+        response.add_post_render_callback(rendered)
+        return response
+
+    def stream(self, content, request, recorder, start):
+        try:
+            with record_queries(recorder):
+                yield from content
+        finally:
+            self.observe(request, recorder, start)
+
+    @staticmethod
+    def observe(request, recorder, start):
+        metrics.observe(
+            request.metrics_labels, time.perf_counter() - start,
+            recorder.count, recorder.seconds, request.serialize_seconds,
+            request.render_seconds,
+        )
@@ -0,0 +1,50 @@
+from rest_framework.response import Response
+
+from .middleware import serialized
+
+
+class CachedReadOnlyMixin:
+    """
+    Отдача list и retrieve справочников из VersionedLRUCache.
+    Кэшируются уже сериализованные данные.
+    """
+
+    reference_cache = None
+
+    def list(self, request, *args, **kwargs):
+        def render():
+            return super(CachedReadOnlyMixin, self).list(
+                request, *args, **kwargs).data
+        return Response(self.reference_cache.get_or_set(('list',), render))
+
+    def retrieve(self, request, *args, **kwargs):
+        def render():
+            return super(CachedReadOnlyMixin, self).retrieve(
+                request, *args, **kwargs).data
+        return Response(self.reference_cache.get_or_set(
+            ('detail', kwargs[self.lookup_url_kwarg or self.lookup_field]),
+            render
+        ))
+
+
+class TimedSerializer:
+    """Сериализатор, у которого время вычисления .data попадает
+    в метрику serialize. Остальные атрибуты — исходного сериализатора."""
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+
+    def __getattr__(self, name):
+        return getattr(self.serializer, name)
+
+    @property
+    def data(self):
+        return serialized(self.serializer)
+
+
+class SerializationTimingMixin:
+    """Замер сериализации для get_serializer() в стандартных
+    действиях DRF и djoser."""
+
+    def get_serializer(self, *args, **kwargs):
+        return TimedSerializer(super().get_serializer(*args, **kwargs))
@@ -1,6 +1,134 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с необязательным режимом курсора.
+    Режим включается представлением через атрибут cursor_ordering:
+    если в запросе есть параметр cursor, страница выбирается условием
+    по этим полям после последней записи предыдущей страницы,
+    без OFFSET и COUNT(*). Порядок задает сам курсор, поэтому
+    параметры сортировки и поиска с ним не сочетаются.
+    """
+
     page_size_query_param = 'limit'
     page_size = 6
+    cursor_query_param = 'cursor'
+    cursor_ordering = None
+    cursor_conflicting_params = ('ordering', 'search')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = getattr(view, 'cursor_ordering', self.cursor_ordering)
+        self.cursor_mode = (
+            self.ordering is not None
+            and self.cursor_query_param in request.query_params
+        )
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        conflicting = [
+            name for name in self.cursor_conflicting_params
+            if request.query_params.get(name)
+        ]
+        if conflicting:
+            raise ValidationError({self.cursor_query_param: (
+                'Курсор нельзя сочетать с параметрами: {0}.'.format(
+                    ', '.join(conflicting)
+                )
+            )})
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params[self.cursor_query_param]
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(
+                self.seek(self.cursor_values(queryset.model, cursor))
+            )
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'results': data,
+        })
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [
+            getattr(last, field.lstrip('-')) for field in self.ordering
+        ]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(values),
+        )
+
+    @staticmethod
+    def encode_cursor(values):
+        # isoformat сохраняет микросекунды, DjangoJSONEncoder их обрезает.
+        raw = json.dumps(values, default=lambda value: value.isoformat())
+        return urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        """Список скалярных значений курсора. Любой курсор не того
+        вида — не base64/JSON, не список нужной длины, вложенные
+        структуры или null — дает 404."""
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(values, list)
+                or len(values) != len(self.ordering)
+                or not all(
+                    isinstance(value, (str, int, float))
+                    and not isinstance(value, bool)
+                    for value in values
+                )):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def cursor_values(self, model, cursor):
+        """Значения полей self.ordering модели model из курсора."""
+        values = self.decode_cursor(cursor)
+        try:
+            values = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (FieldDoesNotExist, DjangoValidationError, TypeError,
+                ValueError, OverflowError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def seek(self, values):
+        """Условие «строго после курсора» для сортировки
+        self.ordering: (a > x) OR (a = x AND b > y) OR ..."""
+        names = [field.lstrip('-') for field in self.ordering]
+        conditions = []
+        for position, field in enumerate(self.ordering):
+            lookup = '{0}__{1}'.format(
+                names[position], 'lt' if field.startswith('-') else 'gt'
+            )
+            equal = dict(zip(names[:position], values[:position]))
+            conditions.append(Q(**equal, **{lookup: values[position]}))
+        return reduce(or_, conditions)
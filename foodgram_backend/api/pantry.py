@@ -0,0 +1,112 @@
+import heapq
+import threading
+from collections import Counter, defaultdict
+from itertools import compress
+
+from foodgram_backend.replicas import read_from_primary
+from recipes.cache import read_changes
+from recipes.models import IngredientRecipe
+
+
+def score(pair):
+    """Ключ сортировки: больше доля имеющихся, меньше недостающих."""
+    count, size = pair
+    return -count / size, size - count
+
+
+class PantryIndex:
+    """
+    Инвертированный индекс в памяти процесса: ингредиент -> список id
+    рецептов. Обновляется по журналу изменений 'pantry', целиком
+    перестраивается, только если журнал потерян. Списки, а не array:
+    они ссылаются на уже существующие int и считаются быстрее.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sequence = None
+        self._recipes = {}
+        self._postings = {}
+
+    def _build(self):
+        recipes = defaultdict(list)
+        postings = defaultdict(list)
+        for recipe_id, ingredient_id in IngredientRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by('recipe_id').iterator():
+            recipes[recipe_id].append(ingredient_id)
+            postings[ingredient_id].append(recipe_id)
+        self._recipes = {
+            recipe_id: frozenset(ingredients)
+            for recipe_id, ingredients in recipes.items()
+        }
+        self._postings = dict(postings)
+
+    def _update(self, recipe_ids):
+        for recipe_id in recipe_ids:
+            for ingredient_id in self._recipes.pop(recipe_id, ()):
+                self._postings[ingredient_id].remove(recipe_id)
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            recipes[recipe_id].add(ingredient_id)
+        for recipe_id, ingredients in recipes.items():
+            self._recipes[recipe_id] = frozenset(ingredients)
+            for ingredient_id in ingredients:
+                self._postings.setdefault(ingredient_id, []).append(recipe_id)
+
+    def _refresh(self):
+        with read_from_primary():
+            sequence, changed = read_changes('pantry', self._sequence)
+            if changed is None:
+                self._build()
+            elif changed:
+                self._update(changed)
+        self._sequence = sequence
+
+    def match(self, ingredients, limit):
+        """
+        Рецепты, отсортированные по доле имеющихся ингредиентов,
+        затем по числу недостающих и новизне:
+        список (id рецепта, совпало, недостающие ингредиенты).
+        """
+        with self._lock:
+            self._refresh()
+            return self._match(frozenset(ingredients), limit)
+
+    def _match(self, pantry, limit):
+        recipes = self._recipes
+        matched = Counter()
+        # Подсчет совпадений по спискам рецептов выполняется в C.
+        for ingredient_id in pantry:
+            matched.update(self._postings.get(ingredient_id, ()))
+        if not matched:
+            return []
+        ids = list(matched)
+        counts = list(matched.values())
+        sizes = list(map(len, map(recipes.__getitem__, ids)))
+        # Порядок зависит только от пары (совпало, всего), различных
+        # пар немного. Рецепты отбираются по уровням оценки, от лучшего,
+        # внутри уровня — самые новые; ключ сортировки на Python
+        # для каждого рецепта не вычисляется.
+        groups = Counter(zip(counts, sizes))
+        levels = defaultdict(set)
+        for pair in groups:
+            levels[score(pair)].add(pair)
+        best = []
+        for level in sorted(levels):
+            if len(best) >= limit:
+                break
+            pairs = levels[level]
+            best.extend(heapq.nlargest(limit - len(best), compress(
+                ids, map(pairs.__contains__, zip(counts, sizes))
+            )))
+        return [
+            (recipe_id, matched[recipe_id],
+             sorted(recipes[recipe_id] - pantry))
+            for recipe_id in best
+        ]
+
+
+pantry_index = PantryIndex()
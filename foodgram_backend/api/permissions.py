@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 
@@ -17,3 +19,18 @@ class IsAdminOrAuthorOrReadOnlyPermission(BasePermission):
             or obj.author == request.user
             or request.user.is_staff
         )
+
+
+class IsAdminOrMetricsToken(BasePermission):
+    """
+    Доступ для сотрудников или по заголовку
+    Authorization: Bearer <METRICS_TOKEN> для сборщика метрик.
+    """
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        token = settings.METRICS_TOKEN
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(token) and constant_time_compare(
+            header, 'Bearer {0}'.format(token)
+        )
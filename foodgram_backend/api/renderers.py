@@ -0,0 +1,153 @@
+import csv
+import io
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+    Построчно отдает строки агрегированного запроса простым текстом;
+    другие форматы переопределяют stream().
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    def stream(self, ingredients):
+        yield 'Cписок покупок:'
+        for ing_nums, ingredient in enumerate(ingredients):
+            yield (
+                f"{', ' if ing_nums else ''}"
+                f"\n{ingredient['ingredient__name']} - "
+                f"{ingredient['ingredient_amount']} "
+                f"{ingredient['ingredient__measurement_unit']}"
+            )
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        )
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['ingredient_amount'],
+                ingredient['ingredient__measurement_unit'],
+            ))
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+
+    def get_font(self):
+        """Шрифт с кириллицей из SHOPPING_LIST_PDF_FONT. Встроенные
+        шрифты PDF кириллицу не содержат, поэтому без него список
+        не строится."""
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFError, TTFont
+
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        try:
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT)
+            )
+        except TTFError as error:
+            logger.error(
+                'Не удалось загрузить шрифт %s: %s',
+                settings.SHOPPING_LIST_PDF_FONT, error
+            )
+            raise ImproperlyConfigured(
+                'SHOPPING_LIST_PDF_FONT: {0}'.format(error)
+            ) from error
+        return self.font_name
+
+    def stream(self, ingredients):
+        """PDF собирается целиком: формат требует таблицу ссылок
+        в конце файла, поэтому документ отдается одним блоком.
+        Шрифт загружается сразу, до начала ответа."""
+        return self.pages(ingredients, self.get_font())
+
+    def pages(self, ingredients, font):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        margin = 50
+        line_height = 18
+        pdf.setFont(font, 16)
+        pdf.drawString(margin, height - margin, 'Список покупок')
+        y = height - margin - 2 * line_height
+        pdf.setFont(font, 12)
+        for ingredient in ingredients:
+            if y < margin:
+                pdf.showPage()
+                pdf.setFont(font, 12)
+                y = height - margin
+            pdf.drawString(
+                margin, y,
+                f"{ingredient['ingredient__name']} - "
+                f"{ingredient['ingredient_amount']} "
+                f"{ingredient['ingredient__measurement_unit']}"
+            )
+            y -= line_height
+        pdf.save()
+        yield buffer.getvalue()
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """
+    Если Accept не подходит ни одному формату (например,
+    application/json), отдается первый рендерер — текстовый файл.
+    Неизвестный ?format= по-прежнему дает 404.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
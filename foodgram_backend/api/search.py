@@ -0,0 +1,109 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+from foodgram_backend.replicas import read_from_primary
+from recipes.cache import get_version
+from recipes.models import Ingredient
+
+
+def normalize(value):
+    return value.strip().casefold()
+
+
+def trigrams(value):
+    padded = '  {0} '.format(normalize(value))
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Snapshot(namedtuple('Snapshot', 'version keys items trigrams')):
+    """Неизменяемое состояние индекса одной версии ингредиентов."""
+
+    def prefix(self, query):
+        """Позиции ингредиентов, название которых начинается с query."""
+        query = normalize(query)
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        return range(start, end)
+
+    def similar(self, query):
+        """Позиции ингредиентов, содержащих похожее на query слово,
+        от более похожих к менее. Сходство — доля триграмм запроса,
+        найденных в названии, как word_similarity в pg_trgm."""
+        query_trigrams = trigrams(query)
+        matches = defaultdict(int)
+        for trigram in query_trigrams:
+            for position in self.trigrams.get(trigram, ()):
+                matches[position] += 1
+        scored = []
+        for position, common in matches.items():
+            similarity = common / len(query_trigrams)
+            if similarity >= settings.INGREDIENT_SEARCH_SIMILARITY:
+                scored.append((-similarity, position))
+        return [position for _, position in sorted(scored)]
+
+
+EMPTY = Snapshot(None, (), (), {})
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+    Поиск по префиксу — бинарный поиск по отсортированным названиям,
+    при отсутствии совпадений — опционально по триграммам.
+    Перестраивается при смене версии 'ingredients': новый снимок
+    подменяется одним присваиванием, а поиск читает снимок один раз,
+    поэтому параллельная перестройка не смешивает ключи и строки
+    разных версий.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = EMPTY
+
+    @staticmethod
+    def _build(version):
+        with read_from_primary():
+            rows = list(
+                Ingredient.objects.values('id', 'name', 'measurement_unit')
+            )
+        rows.sort(key=lambda row: (normalize(row['name']), row['id']))
+        index = defaultdict(list)
+        for position, row in enumerate(rows):
+            for trigram in trigrams(row['name']):
+                index[trigram].append(position)
+        return Snapshot(
+            version,
+            tuple(normalize(row['name']) for row in rows),
+            tuple(rows),
+            {trigram: tuple(positions)
+             for trigram, positions in index.items()},
+        )
+
+    def snapshot(self):
+        """Снимок текущей версии, при необходимости перестроенный."""
+        version = get_version('ingredients')
+        snapshot = self._snapshot
+        if snapshot.version == version:
+            return snapshot
+        with self._lock:
+            if self._snapshot.version != version:
+                self._snapshot = self._build(version)
+            return self._snapshot
+
+    def search(self, query, limit=None, fuzzy=False):
+        snapshot = self.snapshot()
+        # Совпадения по префиксу отдаются в порядке модели: по убыванию.
+        positions = list(reversed(snapshot.prefix(query)))
+        if not positions and fuzzy:
+            positions = snapshot.similar(query)
+        if limit:
+            positions = positions[:limit]
+        return [snapshot.items[position] for position in positions]
+
+
+ingredient_index = IngredientIndex()
@@ -1,14 +1,22 @@
+from collections import OrderedDict
+
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Manager
+from django.urls import reverse
 from rest_framework import serializers
 from djoser.serializers import UserSerializer
 from rest_framework.generics import get_object_or_404
 from rest_framework.validators import UniqueTogetherValidator
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 
 from recipes.models import (Recipe, Ingredient, IngredientRecipe, Tag,
-                            Favorite, ShoppingCart)
+                            Favorite, ShoppingCart, ShoppingListIngredient)
+from jobs.models import Job
 from users.models import Follow, User
-from .fields import Base64ImageField
+from .caching import recipe_fragments
+from .fields import Base64ImageField, ImageVariantsField
+from .tasks import SHOPPING_LIST_JOB
 
 
 class UsersSerializer(UserSerializer):
@@ -16,6 +24,8 @@ class UsersSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj: User):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
@@ -53,9 +63,32 @@ class TagSerializer(serializers.ModelSerializer):
 
 class RecipeShortSerializer(serializers.ModelSerializer):
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class PantryRecipeSerializer(RecipeShortSerializer):
+
+    matched = serializers.IntegerField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+    missing_ingredients = serializers.ListField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = RecipeShortSerializer.Meta.fields + (
+            'matched', 'coverage', 'missing_ingredients'
+        )
+
+
+class PantrySerializer(serializers.Serializer):
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1, max_length=100)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=100, default=settings.PANTRY_RESULTS_LIMIT)
 
 
 class GetIngredientsInRecipeSerializer(serializers.ModelSerializer):
@@ -77,35 +110,138 @@ class GetIngredientsInRecipeSerializer(serializers.ModelSerializer):
         )
 
 
-class GetRecipeSerializer(serializers.ModelSerializer):
+class AuthorSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ("email", "id", "username", "first_name", "last_name")
+
+
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """
+    Часть рецепта, не зависящая от пользователя, — то, что хранится
+    в кэше фрагментов.
+    """
 
     image = Base64ImageField(required=False, allow_null=True)
+    image_variants = ImageVariantsField()
     tags = TagSerializer(many=True, read_only=True)
     ingredients = GetIngredientsInRecipeSerializer(
         many=True,
         read_only=True,
         source="ingredients_in_recipe",
     )
-    author = UsersSerializer(read_only=True)
-    is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
-    is_favorited = serializers.SerializerMethodField(read_only=True)
-
-    def get_is_favorited(self, obj):
-        request = self.context.get("request")
-        if request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=request.user, recipe__id=obj.id).exists()
-
-    def get_is_in_shopping_cart(self, obj):
-        request = self.context.get("request")
-        if request.user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            user=request.user, recipe__id=obj.id).exists()
+    author = AuthorSerializer(read_only=True)
 
     class Meta:
         model = Recipe
+        fields = (
+            "id",
+            "tags",
+            "author",
+            "ingredients",
+            "name",
+            "image",
+            "image_variants",
+            "text",
+            "cooking_time",
+        )
+
+
+class GetRecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        return self.child.render(list(data))
+
+
+class GetRecipeSerializer(RecipeFragmentSerializer):
+    """
+    Рецепт для чтения: фрагмент из кэша плюс признаки текущего
+    пользователя (избранное, корзина, подписка на автора).
+    """
+
+    author = UsersSerializer(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    is_favorited = serializers.BooleanField(read_only=True)
+
+    def to_representation(self, instance):
+        data = self.render([instance])
+        if not data:
+            raise NotFound
+        return data[0]
+
+    def render(self, instances):
+        """Рецепты в порядке instances; удаленные после выборки
+        пропускаются."""
+        request = self.context.get("request")
+        fragments = recipe_fragments.get_many(
+            instances, request,
+            lambda recipe: RecipeFragmentSerializer(
+                recipe, context=self.context
+            ).data,
+        )
+        flags = self.viewer_flags(instances, request)
+        result = []
+        for instance in instances:
+            fragment = fragments.get(instance.pk)
+            if fragment is None:
+                continue
+            favorited, in_cart, subscribed = flags[instance.pk]
+            data = OrderedDict()
+            for field in self.Meta.fields:
+                if field == "is_favorited":
+                    data[field] = favorited
+                elif field == "is_in_shopping_cart":
+                    data[field] = in_cart
+                elif field == "author":
+                    data[field] = OrderedDict(
+                        fragment[field], is_subscribed=subscribed
+                    )
+                else:
+                    data[field] = fragment[field]
+            result.append(data)
+        return result
+
+    @staticmethod
+    def viewer_flags(instances, request):
+        """
+        Признаки пользователя для рецептов: из аннотаций with_user_flags,
+        а если их нет — тремя запросами на все рецепты сразу.
+        """
+        user = request.user if request else None
+        if user is None or user.is_anonymous:
+            return {
+                instance.pk: (False, False, False) for instance in instances
+            }
+        if all(hasattr(instance, "author_is_subscribed")
+               for instance in instances):
+            return {
+                instance.pk: (instance.is_favorited,
+                              instance.is_in_shopping_cart,
+                              instance.author_is_subscribed)
+                for instance in instances
+            }
+        ids = [instance.pk for instance in instances]
+        favorites = set(Favorite.objects.filter(
+            user=user, recipe_id__in=ids
+        ).values_list("recipe_id", flat=True))
+        carts = set(ShoppingCart.objects.filter(
+            user=user, recipe_id__in=ids
+        ).values_list("recipe_id", flat=True))
+        follows = set(Follow.objects.filter(
+            user=user,
+            author_id__in={instance.author_id for instance in instances},
+        ).values_list("author_id", flat=True))
+        return {
+            instance.pk: (instance.pk in favorites,
+                          instance.pk in carts,
+                          instance.author_id in follows)
+            for instance in instances
+        }
+
+    class Meta(RecipeFragmentSerializer.Meta):
         fields = (
             "id",
             "tags",
@@ -115,9 +251,11 @@ class GetRecipeSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time",
         )
+        list_serializer_class = GetRecipeListSerializer
 
 
 class CreateIngredientsInRecipeSerializer(serializers.ModelSerializer):
@@ -163,6 +301,8 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     cooking_time = serializers.IntegerField()
 
     def __create_ingredients(self, recipe, ingredients):
+        if not ingredients:
+            return
         IngredientRecipe.objects.bulk_create([
             IngredientRecipe(
                 recipe=recipe,
@@ -171,6 +311,56 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             ) for ingredient in ingredients
         ])
 
+    def __update_ingredients(self, recipe, ingredients):
+        """
+        Обновление ингредиентов рецепта по разнице с сохраненными:
+        bulk_update для измененных количеств, bulk_create для новых,
+        один DELETE для удаленных. Возвращает старые и новые количества.
+        """
+        stored = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in stored.items()
+        }
+        new_amounts = {
+            ingredient['ingredient'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            row = stored.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        self.__create_ingredients(recipe, [
+            ingredient for ingredient in ingredients
+            if ingredient['ingredient'].id not in stored
+        ])
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        return old_amounts, new_amounts
+
+    def __update_shopping_lists(self, recipe, old_amounts, new_amounts):
+        """Перенос изменений рецепта в списки покупок."""
+        delta = {
+            ingredient_id: (new_amounts.get(ingredient_id, 0)
+                            - old_amounts.get(ingredient_id, 0))
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+            if new_amounts.get(ingredient_id) != old_amounts.get(ingredient_id)
+        }
+        if not delta:
+            return
+        ShoppingListIngredient.objects.add_amounts_for_recipe(
+            recipe.id, delta
+        )
+
     def validate(self, data):
         ingredients = data.get('ingredients')
         tags_ids = data.get('tags')
@@ -214,13 +404,20 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        self.__create_ingredients(instance, ingredients)
+        old_amounts, new_amounts = self.__update_ingredients(
+            instance, ingredients
+        )
+        self.__update_shopping_lists(instance, old_amounts, new_amounts)
+        # tags.set() внутри update() сам меняет только разницу.
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        # Версия рецепта меняется в сигналах после сохранения,
+        # поэтому рецепт для ответа читается заново.
         return GetRecipeSerializer(
-            instance,
+            Recipe.objects.only(
+                'id', 'author_id', 'pub_date', 'version'
+            ).get(pk=instance.pk),
             context={
                 'request': self.context.get('request'),
             }
@@ -247,10 +444,15 @@ class FollowersSerializer(UsersSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
     def get_recipes_count(self, author):
-        return Recipe.objects.filter(author=author).count()
+        return author.recipes_count
 
     def get_recipes(self, author):
         queryset = self.context.get('request')
+        if hasattr(author, 'recipes_preview'):
+            return RecipeShortSerializer(
+                author.recipes_preview,
+                many=True, context={'request': queryset}
+            ).data
         recipes_limit = queryset.query_params.get('recipes_limit')
         if not recipes_limit:
             return RecipeShortSerializer(
@@ -344,3 +546,48 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             fields=('user', 'recipe'),
             message='Рецепт уже в корзине')
         ]
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Для готового списка покупок result — ссылка на скачивание."""
+
+    class Meta:
+        model = Job
+        fields = (
+            'id',
+            'name',
+            'status',
+            'attempts',
+            'result',
+            'error',
+            'created',
+            'finished_at',
+        )
+
+    def to_representation(self, job):
+        data = super().to_representation(job)
+        if job.name == SHOPPING_LIST_JOB and job.status == Job.DONE:
+            url = reverse('jobs-download', args=[job.pk])
+            data['result'] = {
+                'file': self.context['request'].build_absolute_uri(url)
+            }
+        return data
+
+
+class BatchSerializer(serializers.Serializer):
+
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False, default=list, max_length=100)
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False, default=list, max_length=100)
+
+    def validate(self, data):
+        if not data['add'] and not data['remove']:
+            raise ValidationError("Недостаточно данных.")
+        if set(data['add']) & set(data['remove']):
+            raise ValidationError(
+                "Один и тот же id нельзя добавить и удалить."
+            )
+        return data
@@ -0,0 +1,70 @@
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+from jobs.registry import task
+from .renderers import (CSVShoppingListRenderer, PDFShoppingListRenderer,
+                        TextShoppingListRenderer)
+from .utility import get_shopping_list
+
+SHOPPING_LIST_JOB = 'api.shopping_list'
+
+RENDERERS = {
+    renderer.format: renderer
+    for renderer in (TextShoppingListRenderer, CSVShoppingListRenderer,
+                     PDFShoppingListRenderer)
+}
+
+
+def shopping_list_storage():
+    """Файлы списков покупок лежат вне MEDIA_ROOT, в SHOPPING_LISTS_ROOT:
+    nginx их не раздает, владелец скачивает файл через
+    /api/jobs/<id>/download/."""
+    return FileSystemStorage(location=settings.SHOPPING_LISTS_ROOT)
+
+
+@task(SHOPPING_LIST_JOB)
+def render_shopping_list(user_id, format):
+    """Файл списка покупок в SHOPPING_LISTS_ROOT/<user_id>."""
+    renderer = RENDERERS[format]()
+    chunks = renderer.stream(get_shopping_list(user_id))
+    content = b''.join(
+        chunk.encode(renderer.charset) if isinstance(chunk, str) else chunk
+        for chunk in chunks
+    )
+    path = shopping_list_storage().save(
+        '{0}/{1}.{2}'.format(user_id, uuid4().hex, format),
+        ContentFile(content)
+    )
+    purge_shopping_lists(settings.SHOPPING_LIST_FILE_TTL, user_id)
+    return {'path': path, 'format': format}
+
+
+def purge_shopping_lists(max_age, user_id=None):
+    """Удаление файлов списков покупок старше max_age секунд:
+    одного пользователя или всех. Возвращает число удаленных."""
+    storage = shopping_list_storage()
+    if user_id is None:
+        try:
+            users, _ = storage.listdir('')
+        except FileNotFoundError:
+            return 0
+    else:
+        users = [str(user_id)]
+    deadline = time.time() - max_age
+    removed = 0
+    for user in users:
+        try:
+            _, files = storage.listdir(user)
+        except FileNotFoundError:
+            continue
+        for name in files:
+            path = '{0}/{1}'.format(user, name)
+            modified = storage.get_modified_time(path).timestamp()
+            if modified < deadline:
+                storage.delete(path)
+                removed += 1
+    return removed
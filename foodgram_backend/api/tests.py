@@ -0,0 +1,198 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from jobs.models import Job
+from jobs.registry import run_job
+from recipes.models import Ingredient, Recipe, ShoppingListIngredient
+from users.models import User
+from .authentication import CachedTokenAuthentication
+from .metrics import MetricsRegistry
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class RecipeFragmentTests(TestCase):
+    """Кэш фрагментов рецептов и версии рецептов."""
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.author = User.objects.create_user(
+            username='author', email='author@mail.ru', password='pass',
+            first_name='Автор', last_name='Автор',
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='Текст', cooking_time=5
+        )
+        self.client = APIClient()
+
+    def name(self):
+        response = self.client.get(
+            '/api/recipes/{0}/'.format(self.recipe.pk)
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data['name']
+
+    def test_updates_from_stale_instances_refresh_fragment(self):
+        first = Recipe.objects.get(pk=self.recipe.pk)
+        second = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertEqual(self.name(), 'Суп')
+        first.name = 'Борщ'
+        first.save()
+        self.assertEqual(self.name(), 'Борщ')
+        second.name = 'Щи'
+        second.save()
+        self.assertEqual(self.name(), 'Щи')
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).version, 3
+        )
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class CachedTokenAuthenticationTests(TestCase):
+    """Кэш токенов: снимок пользователя только для чтения."""
+
+    def setUp(self):
+        caches['coordination'].clear()
+        CachedTokenAuthentication._entries.clear()
+        CachedTokenAuthentication._user_ids.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@mail.ru', password='pass',
+            first_name='Читатель', last_name='Читатель',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Token ' + self.token.key
+        )
+
+    def test_miss_costs_one_query(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                CachedTokenAuthentication().authenticate_credentials(
+                    self.token.key
+                )
+            CachedTokenAuthentication._entries.clear()
+
+    def test_write_does_not_save_cached_snapshot(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        # Изменение без сигналов: версия не меняется, снимок в кэше
+        # устарел.
+        User.objects.filter(pk=self.user.pk).update(first_name='Новое')
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'pass', 'new_password': 'Pass-54321y',
+        })
+        self.assertEqual(response.status_code, 204)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.first_name, 'Новое')
+        self.assertTrue(user.check_password('Pass-54321y'))
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class ShoppingListJobTests(TestCase):
+    """Файл списка покупок из фоновой задачи доступен только владельцу."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username='owner', email='owner@mail.ru', password='pass',
+            first_name='Владелец', last_name='Владелец',
+        )
+        self.other = User.objects.create_user(
+            username='other', email='other@mail.ru', password='pass',
+            first_name='Другой', last_name='Другой',
+        )
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        ShoppingListIngredient.objects.add_amounts(
+            self.owner.pk, {ingredient.pk: 5}
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_download_only_by_owner(self):
+        client = self.client_for(self.owner)
+        response = client.get(
+            '/api/recipes/download_shopping_cart/?format=csv&async=1'
+        )
+        self.assertEqual(response.status_code, 202)
+        job_id = json.loads(response.content)['id']
+        self.assertEqual(run_job(job_id), Job.DONE)
+        url = client.get(
+            '/api/jobs/{0}/'.format(job_id)
+        ).data['result']['file']
+        self.assertTrue(url.endswith('/api/jobs/{0}/download/'.format(
+            job_id
+        )))
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Соль', b''.join(response.streaming_content).decode())
+        response.close()
+        self.assertEqual(
+            self.client_for(self.other).get(url).status_code, 404
+        )
+        self.assertEqual(APIClient().get(url).status_code, 401)
+        self.assertFalse(os.path.exists(
+            os.path.join(settings.MEDIA_ROOT, 'shopping_lists')
+        ))
+
+
+class MetricsSnapshotTests(SimpleTestCase):
+    """Снимки метрик воркеров в METRICS_DIR."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        override = override_settings(METRICS_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def observe(self, registry):
+        registry.observe(('view', 'list', 'GET'), 0.01, 1, 0.001, 0, 0)
+
+    def write(self, name, age=0):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as file:
+            json.dump([[['old', 'list', 'GET'], {'count': 1}]], file)
+        if age:
+            os.utime(path, (os.path.getmtime(path) - age,) * 2)
+        return path
+
+    def test_one_file_per_process(self):
+        registry = MetricsRegistry()
+        for _ in range(3):
+            self.observe(registry)
+            registry.flush()
+        self.assertEqual(
+            os.listdir(self.directory), ['{0}.json'.format(os.getpid())]
+        )
+
+    def test_dead_and_stale_snapshots_dropped(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        dead = self.write('{0}.json'.format(process.pid))
+        # Процесс 1 жив, но снимок давно не обновлялся.
+        stale = self.write('1.json', age=10 ** 6)
+        legacy = self.write('{0}-1.json'.format(os.getppid()))
+        alive = self.write('{0}.json'.format(os.getppid()))
+        registry = MetricsRegistry()
+        self.observe(registry)
+        with override_settings(METRICS_SNAPSHOT_TTL=60):
+            total = registry.collect()
+        self.assertEqual(total[('old', 'list', 'GET')]['count'], 1)
+        self.assertEqual(total[('view', 'list', 'GET')]['count'], 1)
+        for path in (dead, stale, legacy):
+            self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(alive))
@@ -1,16 +1,30 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import RecipeViewSet, UsersViewSet, TagViewSet, IngredientViewSet
+from . import async_views
+from .views import (RecipeViewSet, UsersViewSet, TagViewSet,
+                    IngredientViewSet, JobViewSet, MetricsView)
 
 router = DefaultRouter()
 router.register('recipes', RecipeViewSet)
 router.register('users', UsersViewSet)
 router.register('ingredients', IngredientViewSet)
 router.register('tags', TagViewSet)
+router.register('jobs', JobViewSet, basename='jobs')
 
 
 urlpatterns = (
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('_metrics', MetricsView.as_view(), name='metrics'),
 )
+
+if settings.SERVER_MODE == 'asgi':
+    # Под ASGI справочники отдаются корутинами, раньше маршрутов роутера.
+    urlpatterns = (
+        path('tags/', async_views.tag_list),
+        path('tags/<int:pk>/', async_views.tag_detail),
+        path('ingredients/', async_views.ingredient_list),
+        path('ingredients/<int:pk>/', async_views.ingredient_detail),
+    ) + urlpatterns
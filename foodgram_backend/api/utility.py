@@ -1,26 +1,66 @@
-from django.http import HttpResponse
-from django.db.models import Sum
+import tempfile
 
-from recipes.models import IngredientRecipe
+from django.conf import settings
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import F
+from rest_framework import status
 
+from jobs.registry import enqueue
+from recipes.models import ShoppingListIngredient
 
-def download_shopping_list(request):
-    ingredient_list = "Cписок покупок:"
-    ingredients = IngredientRecipe.objects.filter(
-        recipe__shopping_cart__user=request.user
-    ).values(
+SHOPPING_LIST_CHUNK_SIZE = 2000
+# Сколько байт списка под ASGI держится в памяти, прежде чем
+# временный файл уходит на диск.
+SHOPPING_LIST_SPOOL_SIZE = 1024 * 1024
+
+
+def get_shopping_list(user):
+    """Суммарный список ингредиентов из корзины пользователя."""
+    return ShoppingListIngredient.objects.filter(user=user).values(
         'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(ingredient_amount=Sum('amount'))
-    for ing_nums, ingredient in enumerate(ingredients):
-        ingredient_list += (
-            f"\n{ingredient['ingredient__name']} - "
-            f"{ingredient['ingredient_amount']} "
-            f"{ingredient['ingredient__measurement_unit']}"
+    ).annotate(
+        ingredient_amount=F('amount')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def download_shopping_list(request):
+    renderer = request.accepted_renderer
+    if request.query_params.get('async') in ('1', 'true'):
+        job = enqueue(
+            'api.shopping_list', request.user.id, renderer.format,
+            user=request.user
+        )
+        return JsonResponse(
+            {'id': job.id, 'status': job.status},
+            status=status.HTTP_202_ACCEPTED
+        )
+    ingredients = get_shopping_list(request.user).iterator(
+        chunk_size=SHOPPING_LIST_CHUNK_SIZE
+    )
+    content = renderer.stream(ingredients)
+    filename = 'shopping_list.{0}'.format(renderer.format)
+    content_type = '{0}; charset={1}'.format(
+        renderer.media_type, renderer.charset
+    ) if renderer.charset else renderer.media_type
+    if settings.SERVER_MODE == 'asgi':
+        # Django 3.2 под ASGI перебирает потоковый ответ прямо в цикле
+        # событий, где ORM недоступен: в потоке представления строки
+        # пишутся во временный файл (в памяти только первые
+        # SHOPPING_LIST_SPOOL_SIZE байт), и клиенту он отдается частями.
+        spool = tempfile.SpooledTemporaryFile(
+            max_size=SHOPPING_LIST_SPOOL_SIZE
+        )
+        for chunk in content:
+            spool.write(
+                chunk.encode(renderer.charset)
+                if isinstance(chunk, str) else chunk
+            )
+        spool.seek(0)
+        return FileResponse(
+            spool, as_attachment=True, filename=filename,
+            content_type=content_type
         )
-        if ing_nums < ingredients.count() - 1:
-            ingredient_list += ', '
-    filename = 'shopping_list.txt'
-    response = HttpResponse(ingredient_list, content_type='text/plain')
+    response = StreamingHttpResponse(content, content_type=content_type)
     response['Content-Disposition'] = (
         'attachment; filename={0}'.format(filename)
     )
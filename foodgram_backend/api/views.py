@@ -1,38 +1,79 @@
+from django.conf import settings
+from django.db.models import BooleanField, Prefetch, Value
+from django.db.models.query import prefetch_related_objects
+from django.http import FileResponse, Http404
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
-from rest_framework.permissions import (SAFE_METHODS, IsAuthenticated,
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework import status
 from djoser.views import UserViewSet
 
+from foodgram_backend.replicas import read_from_primary
+from jobs.models import Job
+from recipes.cache import VersionedLRUCache
 from recipes.models import Recipe, Tag, Ingredient, ShoppingCart, Favorite
 from users.models import Follow, User
 from .serializers import (IngredientSerializer, TagSerializer,
                           FollowersSerializer, FollowSerializer,
                           GetRecipeSerializer, CreateRecipeSerializer,
-                          ShoppingCartSerializer, FavoriteSerializer)
-from .permissions import IsAdminOrAuthorOrReadOnlyPermission
+                          ShoppingCartSerializer, FavoriteSerializer,
+                          JobSerializer, BatchSerializer,
+                          PantrySerializer, PantryRecipeSerializer)
+from .batch import (apply_batch, carts_changed, favorites_changed,
+                    follows_changed)
+from .caching import recipe_page_cache
+from .middleware import serialized
+from .mixins import CachedReadOnlyMixin, SerializationTimingMixin
+from .permissions import (IsAdminOrAuthorOrReadOnlyPermission,
+                          IsAdminOrMetricsToken)
+from .metrics import metrics
+from .feed import FeedPagination
 from .pagination import CustomPagination
+from .pantry import pantry_index
 from .filters import RecipeFilter, IngredientFilter
+from .renderers import (TextShoppingListRenderer, CSVShoppingListRenderer,
+                        PDFShoppingListRenderer, PrometheusRenderer,
+                        ShoppingListNegotiation)
+from .search import ingredient_index
+from .tasks import RENDERERS, SHOPPING_LIST_JOB, shopping_list_storage
 from .utility import download_shopping_list
 
 
-class UsersViewSet(UserViewSet):
+class UsersViewSet(SerializationTimingMixin, UserViewSet):
+    cursor_ordering = ('id',)
 
-    @action(methods=['GET'], detail=False)
+    @action(
+        methods=['GET'], detail=False, permission_classes=(IsAuthenticated,)
+    )
     def subscriptions(self, request):
         subscriptions_list = self.paginate_queryset(
-            User.objects.filter(following__user=request.user)
+            User.objects.filter(following__user=request.user).annotate(
+                is_subscribed=Value(True, output_field=BooleanField()),
+            ).order_by('id')
+        )
+        recipes_limit = request.query_params.get('recipes_limit')
+        recipes = Recipe.objects.all()
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = Recipe.objects.first_per_author(
+                subscriptions_list, int(recipes_limit)
+            )
+        prefetch_related_objects(
+            subscriptions_list,
+            Prefetch('recipes', queryset=recipes, to_attr='recipes_preview')
         )
         serializer = FollowersSerializer(
             subscriptions_list, many=True, context={
                 'request': request
             }
         )
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(serialized(serializer))
 
     @action(methods=['POST', 'DELETE'], detail=True)
     def subscribe(self, request, id):
@@ -57,47 +98,111 @@ class UsersViewSet(UserViewSet):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serialized(serializer),
+                        status=status.HTTP_201_CREATED)
 
+    @action(
+        methods=['POST'], detail=False, permission_classes=(IsAuthenticated,)
+    )
+    def subscribe_batch(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(apply_batch(
+            request.user, Follow, 'author', User.objects.all(),
+            on_change=follows_changed, forbidden={request.user.id},
+            **serializer.validated_data
+        ))
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(CachedReadOnlyMixin, SerializationTimingMixin,
+                 viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrAuthorOrReadOnlyPermission,)
     pagination_class = None
+    reference_cache = VersionedLRUCache(
+        'tags', maxsize=settings.REFERENCE_CACHE_SIZE
+    )
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedReadOnlyMixin, SerializationTimingMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrAuthorOrReadOnlyPermission,)
     filter_backends = [IngredientFilter, ]
     search_fields = ['^name', ]
     pagination_class = None
+    reference_cache = VersionedLRUCache(
+        'ingredients', maxsize=settings.REFERENCE_CACHE_SIZE
+    )
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(IngredientFilter.search_param)
+        if not name:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get('limit', '')
+        return Response(ingredient_index.search(
+            name,
+            limit=(int(limit) if limit.isdigit()
+                   else settings.INGREDIENT_SEARCH_LIMIT),
+            fuzzy=request.query_params.get('fuzzy') in ('1', 'true'),
+        ))
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(SerializationTimingMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = GetRecipeSerializer
     pagination_class = CustomPagination
-    filter_backends = (DjangoFilterBackend,)
+    cursor_ordering = ('-pub_date', '-id')
+    filter_backends = (DjangoFilterBackend, OrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
     permission_classes = (
         IsAdminOrAuthorOrReadOnlyPermission, IsAuthenticatedOrReadOnly
     )
 
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            # Содержимое рецептов берется из кэша фрагментов,
+            # здесь нужны только id, версия, автор и признаки
+            # пользователя.
+            return Recipe.objects.only(
+                'id', 'author_id', 'pub_date', 'version'
+            ).with_user_flags(self.request.user)
+        return super().get_queryset()
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return GetRecipeSerializer
         return CreateRecipeSerializer
 
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key = recipe_page_cache.key(request)
+        data = recipe_page_cache.get(key)
+        if data is None:
+            with read_from_primary():
+                response = super().list(request, *args, **kwargs)
+            recipe_page_cache.set(key, response.data)
+            return response
+        return Response(data)
+
+    @action(
+        detail=False, methods=['GET'], permission_classes=(IsAdminUser,)
+    )
+    def cache_stats(self, request):
+        return Response(recipe_page_cache.stats())
+
     @staticmethod
     def __post_method_for_actions(request, pk, serializers):
         data = {'user': request.user.id, 'recipe': pk}
         serializer = serializers(data=data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serialized(serializer),
+                        status=status.HTTP_201_CREATED)
 
     @staticmethod
     def __delete_method_for_actions(request, pk, model):
@@ -110,6 +215,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    @staticmethod
+    def __batch_method_for_actions(request, model, on_change):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(apply_batch(
+            request.user, model, 'recipe', Recipe.objects.all(),
+            on_change=on_change, **serializer.validated_data
+        ))
+
     @action(detail=True, methods=['POST'])
     def shopping_cart(self, request, pk):
         return self.__post_method_for_actions(
@@ -125,9 +239,67 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(
         detail=False, methods=['GET'], permission_classes=(IsAuthenticated,)
     )
+    def feed(self, request):
+        """Рецепты авторов из подписок, от новых к старым."""
+        paginator = FeedPagination()
+        page = paginator.paginate_feed(
+            self.get_queryset(), request, request.user
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['GET'])
+    def pantry(self, request):
+        """Что можно приготовить из ингредиентов ?ingredients=."""
+        serializer = PantrySerializer(data={
+            'ingredients': request.query_params.getlist('ingredients'),
+            'limit': request.query_params.get(
+                'limit', settings.PANTRY_RESULTS_LIMIT
+            ),
+        })
+        serializer.is_valid(raise_exception=True)
+        matches = pantry_index.match(**serializer.validated_data)
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        results = []
+        for recipe_id, matched, missing in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.matched = matched
+            recipe.coverage = round(matched / (matched + len(missing)), 4)
+            recipe.missing_ingredients = missing
+            results.append(recipe)
+        return Response(serialized(PantryRecipeSerializer(
+            results, many=True, context={'request': request}
+        )))
+
+    @action(
+        detail=False, methods=['GET'], permission_classes=(IsAuthenticated,),
+        renderer_classes=(TextShoppingListRenderer, CSVShoppingListRenderer,
+                          PDFShoppingListRenderer),
+        content_negotiation_class=ShoppingListNegotiation,
+    )
     def download_shopping_cart(self, request):
         return download_shopping_list(request)
 
+    @action(
+        detail=False, methods=['POST'], permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_batch(self, request):
+        return self.__batch_method_for_actions(
+            request, model=ShoppingCart, on_change=carts_changed
+        )
+
+    @action(
+        detail=False, methods=['POST'], permission_classes=(IsAuthenticated,)
+    )
+    def favorite_batch(self, request):
+        return self.__batch_method_for_actions(
+            request, model=Favorite, on_change=favorites_changed
+        )
+
     @action(detail=True, methods=['POST'])
     def favorite(self, request, pk):
         return self.__post_method_for_actions(
@@ -138,3 +310,45 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def delete_favorite(self, request, pk):
         return self.__delete_method_for_actions(
             request=request, pk=pk, model=Favorite)
+
+
+class JobViewSet(SerializationTimingMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(user=self.request.user)
+
+    @action(detail=True, methods=['GET'])
+    def download(self, request, pk=None):
+        """Файл готового списка покупок — только владельцу задачи."""
+        job = self.get_object()
+        result = job.result or {}
+        if (job.name != SHOPPING_LIST_JOB or job.status != Job.DONE
+                or 'path' not in result):
+            raise Http404
+        try:
+            file = shopping_list_storage().open(result['path'])
+        except FileNotFoundError:
+            # Файл уже удален по SHOPPING_LIST_FILE_TTL.
+            raise Http404
+        renderer = RENDERERS[result['format']]
+        return FileResponse(
+            file, as_attachment=True,
+            filename='shopping_list.{0}'.format(renderer.format),
+            content_type='{0}; charset={1}'.format(
+                renderer.media_type, renderer.charset
+            ) if renderer.charset else renderer.media_type
+        )
+
+
+class MetricsView(APIView):
+    """Метрики запросов всех воркеров в формате Prometheus."""
+
+    permission_classes = (IsAdminOrMetricsToken,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(metrics.exposition())
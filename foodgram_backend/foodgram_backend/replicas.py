@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import get_authorization_header
+from rest_framework.permissions import SAFE_METHODS
+
+# Реплика, выбранная для текущего запроса; None — чтение с primary.
+# Вне запросов (команды, воркер задач, shell) все читается с primary.
+read_database = ContextVar('read_database', default=None)
+
+PIN_COOKIE = 'primary_pin'
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Чтение с primary внутри блока: для только что созданных записей
+    и для всего, что кэшируется под версией данных, — иначе отставшая
+    реплика закрепит в кэше старые данные до следующей смены версии.
+    """
+    token = read_database.set(None)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Чтение — с реплики, которую ReplicaMiddleware выбрала для текущего
+    запроса: все запросы одного ответа видят один снимок данных.
+    Запись и миграции — только default.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaMiddleware:
+    """
+    Разрешает чтение с реплик для безопасных запросов. После успешной
+    записи клиент на REPLICA_PIN_SECONDS закрепляется за primary —
+    по токену (общий кэш) и по cookie, — чтобы сразу видеть свои
+    изменения.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = read_database.set(self.choose_database(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_database.reset(token)
+        if self.wrote(request, response):
+            self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        database = None
+        if settings.DATABASE_REPLICAS and request.method in SAFE_METHODS:
+            database = await sync_to_async(self.choose_database)(request)
+        token = read_database.set(database)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_database.reset(token)
+        if self.wrote(request, response):
+            await sync_to_async(self.pin)(request, response)
+        return response
+
+    def choose_database(self, request):
+        """Случайная реплика на весь запрос или None — primary."""
+        if (not settings.DATABASE_REPLICAS
+                or request.method not in SAFE_METHODS
+                or PIN_COOKIE in request.COOKIES):
+            return None
+        key = self.pin_key(request)
+        if key is not None and caches['coordination'].get(key) is not None:
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    @staticmethod
+    def wrote(request, response):
+        return (
+            bool(settings.DATABASE_REPLICAS)
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+        )
+
+    def pin(self, request, response):
+        key = self.pin_key(request)
+        if key is not None:
+            caches['coordination'].set(
+                key, 1, settings.REPLICA_PIN_SECONDS
+            )
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+            httponly=True, samesite='Lax',
+        )
+
+    @staticmethod
+    def pin_key(request):
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() != b'token':
+            return None
+        return 'replica-pin:{0}'.format(hashlib.sha256(auth[1]).hexdigest())
@@ -28,11 +28,14 @@ INSTALLED_APPS = [
     'api',
     'recipes',
     'users',
+    'jobs',
     'colorfield',
     'django_filters',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
+    'foodgram_backend.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +77,68 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host1:5432,host2. Имя базы,
+# пользователь и пароль те же, что у default. В тестах реплики
+# зеркалируют тестовую базу default.
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1
+):
+    host, _, port = address.strip().partition(':')
+    alias = 'replica{0}'.format(number)
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=port or DATABASES['default']['PORT'],
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram_backend.replicas.ReplicaRouter']
+# Сколько секунд после записи клиент читает только с primary.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
+SHARED_CACHE_BACKEND = os.getenv(
+    'SHARED_CACHE_BACKEND',
+    'django.core.cache.backends.filebased.FileBasedCache'
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Объемные данные, которые можно потерять: фрагменты и страницы
+    # рецептов, счетчики попаданий. В docker-compose — memcached.
+    'shared': {
+        'BACKEND': SHARED_CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'SHARED_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')
+        ),
+    },
+    # Версии данных и закрепления за primary. У всех ключей есть срок
+    # жизни; версии — случайные токены, поэтому вытесненная версия
+    # только перестраивает кэши воркеров. При переполнении удаляется
+    # 1/CULL_FREQUENCY случайных ключей: запас MAX_ENTRIES над числом
+    # активных закреплений держит потерю живых ключей редкой.
+    'coordination': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'COORDINATION_CACHE_LOCATION',
+            os.path.join(BASE_DIR, 'coordination')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('COORDINATION_CACHE_MAX_ENTRIES', 50000)
+            ),
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+if SHARED_CACHE_BACKEND.endswith('FileBasedCache'):
+    CACHES['shared']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('SHARED_CACHE_MAX_ENTRIES', 10000)),
+    }
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -108,6 +173,49 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+JOBS_MAX_ATTEMPTS = 3
+JOBS_RETRY_DELAY = 30
+# Файлы списков покупок из фоновых задач: вне MEDIA_ROOT, чтобы их
+# не раздавал nginx.
+SHOPPING_LISTS_ROOT = os.getenv(
+    'SHOPPING_LISTS_ROOT', os.path.join(BASE_DIR, 'shopping_lists')
+)
+# Сколько секунд хранятся файлы списков покупок из фоновых задач.
+SHOPPING_LIST_FILE_TTL = int(os.getenv('SHOPPING_LIST_FILE_TTL', 24 * 60 * 60))
+
+REFERENCE_CACHE_SIZE = int(os.getenv('REFERENCE_CACHE_SIZE', 4096))
+
+# wsgi — gunicorn с sync-воркерами, asgi — gunicorn с воркерами uvicorn
+# и асинхронными представлениями справочников (см. gunicorn.conf.py).
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
+RECIPE_PAGE_CACHE_TIMEOUT = int(os.getenv('RECIPE_PAGE_CACHE_TIMEOUT', 300))
+RECIPE_FRAGMENT_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_FRAGMENT_CACHE_TIMEOUT', 3600)
+)
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 0))
+INGREDIENT_SEARCH_SIMILARITY = 0.5
+
+PANTRY_RESULTS_LIMIT = int(os.getenv('PANTRY_RESULTS_LIMIT', 20))
+
+FEED_PULL_FOLLOWERS = int(os.getenv('FEED_PULL_FOLLOWERS', 1000))
+FEED_BACKFILL_LIMIT = 100
+
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 60))
+
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+METRICS_FLUSH_INTERVAL = 5
+# Снимок воркера, не обновлявшийся столько секунд, при сборе удаляется.
+METRICS_SNAPSHOT_TTL = int(os.getenv('METRICS_SNAPSHOT_TTL', 24 * 60 * 60))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = "users.User"
@@ -129,7 +237,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
     'PAGE_SIZE': 6,
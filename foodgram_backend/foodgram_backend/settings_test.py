@@ -0,0 +1,26 @@
+"""
+Настройки для тестов: python manage.py test
+--settings=foodgram_backend.settings_test. Primary и реплики — отдельные
+базы SQLite в памяти; данные на реплики тесты копируют сами, чтобы
+проверять чтение с отставшей реплики.
+"""
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+DATABASE_REPLICAS = ['replica1', 'replica2']
+DATABASES = {
+    alias: {'ENGINE': 'django.db.backends.sqlite3'}
+    for alias in ['default', *DATABASE_REPLICAS]
+}
+
+for alias in ('shared', 'coordination'):
+    CACHES[alias] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': alias,
+    }
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='foodgram-media-')
+METRICS_DIR = tempfile.mkdtemp(prefix='foodgram-metrics-')
+SHOPPING_LISTS_ROOT = tempfile.mkdtemp(prefix='foodgram-shopping-lists-')
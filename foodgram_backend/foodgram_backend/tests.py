@@ -0,0 +1,113 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.models import Follow, User
+
+DATABASES = {'default', *settings.DATABASE_REPLICAS}
+
+
+@override_settings(REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Чтение с реплик. Реплики — отдельные базы SQLite, которые получают
+    данные primary только в replicate(), поэтому отставание видно.
+    """
+
+    databases = DATABASES
+
+    def setUp(self):
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@mail.ru', password='pass',
+            first_name='Читатель', last_name='Читатель',
+        )
+        self.author = User.objects.create_user(
+            username='author', email='author@mail.ru', password='pass',
+            first_name='Автор', last_name='Автор',
+        )
+        self.token = Token.objects.create(user=self.reader)
+        self.replicate()
+
+    @staticmethod
+    def replicate():
+        """Копия primary на все реплики."""
+        connections['default'].ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias].ensure_connection()
+            connections['default'].connection.backup(
+                connections[alias].connection
+            )
+
+    def client_for(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        return client
+
+    def subscriptions(self, client):
+        response = client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 200)
+        return [user['id'] for user in response.data['results']]
+
+    def test_unpinned_client_reads_replica(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        client = self.client_for(self.token)
+        self.assertEqual(self.subscriptions(client), [])
+        self.replicate()
+        self.assertEqual(self.subscriptions(client), [self.author.id])
+
+    def test_request_reads_one_replica(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.replicate()
+        client = self.client_for(self.token)
+        for _ in range(10):
+            with ExitStack() as stack:
+                captured = {
+                    alias: stack.enter_context(
+                        CaptureQueriesContext(connections[alias])
+                    )
+                    for alias in settings.DATABASE_REPLICAS
+                }
+                self.subscriptions(client)
+            used = [
+                alias for alias, context in captured.items()
+                if len(context)
+            ]
+            self.assertEqual(len(used), 1)
+
+    def test_client_reads_own_writes_after_post(self):
+        client = self.client_for(self.token)
+        response = client.post(
+            '/api/users/{0}/subscribe/'.format(self.author.id)
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.subscriptions(client), [self.author.id])
+        # Закрепление по токену работает и без cookie.
+        self.assertEqual(
+            self.subscriptions(self.client_for(self.token)),
+            [self.author.id]
+        )
+        # Другой клиент по-прежнему читает с отставшей реплики.
+        other = User.objects.create_user(
+            username='other', email='other@mail.ru', password='pass',
+            first_name='Другой', last_name='Другой',
+        )
+        Follow.objects.create(user=other, author=self.author)
+        self.replicate()
+        Follow.objects.filter(user=other).delete()
+        self.assertEqual(
+            self.subscriptions(self.client_for(Token.objects.create(
+                user=other
+            ))),
+            [self.author.id]
+        )
+
+    def test_new_token_authenticates_from_primary(self):
+        token = Token.objects.create(user=self.author)
+        response = self.client_for(token).get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.author.id)
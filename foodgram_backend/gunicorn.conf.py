@@ -0,0 +1,19 @@
+import os
+
+# Режим сервера задается той же переменной, что и settings.SERVER_MODE.
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'foodgram_backend.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+elif SERVER_MODE == 'wsgi':
+    wsgi_app = 'foodgram_backend.wsgi:application'
+else:
+    raise RuntimeError(
+        'SERVER_MODE должен быть wsgi или asgi, получено {0!r}.'.format(
+            SERVER_MODE
+        )
+    )
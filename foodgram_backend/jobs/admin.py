@@ -0,0 +1,22 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """
+    Панель админа для просмотра фоновых задач
+    """
+
+    list_display = (
+        "id",
+        "name",
+        "status",
+        "attempts",
+        "run_at",
+        "finished_at",
+    )
+    list_display_links = ("id", "name")
+    search_fields = ("name",)
+    list_filter = ("status", "name")
@@ -0,0 +1,72 @@
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.registry import claim, requeue_stale, run_job
+
+
+def close_connections():
+    # Дочерний процесс не должен использовать соединение родителя.
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди в пуле потоков или процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pool', choices=('thread', 'process'), default='thread',
+            help='Тип пула исполнителей.'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Количество одновременно выполняемых задач.'
+        )
+        parser.add_argument(
+            '--poll', type=float, default=1.0,
+            help='Пауза между проверками пустой очереди, секунд.'
+        )
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help='Через сколько секунд зависшая задача возвращается '
+                 'в очередь.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if options['pool'] == 'process':
+            close_connections()
+            pool = ProcessPoolExecutor(
+                max_workers=concurrency, initializer=close_connections
+            )
+        else:
+            pool = ThreadPoolExecutor(
+                max_workers=concurrency, thread_name_prefix='jobs'
+            )
+        self.stdout.write('runjobs: {0} pool, concurrency {1}'.format(
+            options['pool'], concurrency
+        ))
+        running = set()
+        with pool:
+            while True:
+                requeue_stale(options['stale_after'])
+                for job_id in claim(concurrency - len(running)):
+                    running.add(pool.submit(run_job, job_id))
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+                done, running = wait(
+                    running, timeout=options['poll'],
+                    return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    future.result()
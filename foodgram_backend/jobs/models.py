@@ -0,0 +1,60 @@
+from django.db import models
+from django.utils import timezone
+
+from users.models import User
+
+
+class Job(models.Model):
+    """
+    Фоновая задача. Выполняется командой runjobs.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(max_length=100, verbose_name='Задача')
+    args = models.JSONField(default=list, blank=True,
+                            verbose_name='Аргументы')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=QUEUED, verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0,
+                                                verbose_name='Попыток')
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3, verbose_name='Максимум попыток')
+    run_at = models.DateTimeField(default=timezone.now,
+                                  verbose_name='Запуск не раньше')
+    locked_at = models.DateTimeField(null=True, blank=True,
+                                     verbose_name='Взята в работу')
+    result = models.JSONField(null=True, blank=True,
+                              verbose_name='Результат')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    user = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        verbose_name='Пользователь'
+    )
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name='Создана')
+    finished_at = models.DateTimeField(null=True, blank=True,
+                                       verbose_name='Завершена')
+
+    class Meta:
+        ordering = ('-created',)
+        indexes = [models.Index(fields=['status', 'run_at'],
+                                name='job_status_run_at_idx')]
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,105 @@
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = {}
+
+
+def task(name):
+    """Регистрация функции как фоновой задачи с именем name."""
+    def decorator(func):
+        REGISTRY[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, *args, user=None, max_attempts=None):
+    """Постановка задачи в очередь. Внутри транзакции задача станет
+    видна воркеру только вместе с остальными изменениями."""
+    if name not in REGISTRY:
+        raise KeyError('Unknown job: {0}'.format(name))
+    return Job.objects.create(
+        name=name,
+        args=list(args),
+        user=user,
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def claim(limit):
+    """Захват до limit готовых к запуску задач. Задача достается тому
+    воркеру, чей UPDATE первым сменил ее статус, поэтому несколько
+    воркеров могут работать с одной очередью."""
+    if limit <= 0:
+        return []
+    candidates = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=timezone.now()
+    ).order_by('run_at').values_list('pk', flat=True)[:limit]
+    return [
+        pk for pk in candidates
+        if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            locked_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+    ]
+
+
+def requeue_stale(timeout):
+    """Возврат в очередь задач, воркер которых завершился аварийно.
+    Задача, исчерпавшая попытки, помечается ошибкой: иначе задача,
+    роняющая воркер, возвращалась бы в очередь бесконечно."""
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=timeout),
+    )
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED,
+        locked_at=None,
+        finished_at=timezone.now(),
+        error='Воркер завершился аварийно.',
+    )
+    return stale.update(status=Job.QUEUED, locked_at=None)
+
+
+def backoff(attempts):
+    return timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def run_job(job_id):
+    """Выполнение захваченной задачи с повтором при ошибке."""
+    job = Job.objects.get(pk=job_id)
+    fields = ['status', 'error', 'run_at', 'finished_at', 'locked_at']
+    try:
+        result = REGISTRY[job.name](*job.args)
+        # Результат, который нельзя сохранить в JSONField, — ошибка
+        # задачи, а не сохранения: иначе задача осталась бы RUNNING.
+        json.dumps(result)
+        job.result = result
+        fields.append('result')
+        job.status = Job.DONE
+        job.error = ''
+        job.finished_at = timezone.now()
+    except Exception as error:
+        logger.exception('Job %s failed', job)
+        job.error = repr(error)
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+        else:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + backoff(job.attempts)
+    finally:
+        job.locked_at = None
+        job.save(update_fields=fields)
+        connection.close()
+    return job.status
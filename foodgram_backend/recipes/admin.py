@@ -59,8 +59,9 @@ class RecipeAdmin(admin.ModelAdmin):
     filter_horizontal = ("tags",)
     inlines = (IngredientsRecipeAdmin,)
 
+    @admin.display(description='В избранном', ordering='favorites_count')
     def in_favorited(self, obj):
-        return obj.in_favorited.all().count()
+        return obj.favorites_count
 
 
 @admin.register(Favorite)
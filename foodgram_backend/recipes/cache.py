@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from foodgram_backend.replicas import read_from_primary
+from .models import ChangeLog
+
+VERSION_KEY = 'version:{0}'
+# Версия со временем истекает: следующий get_version выдает новый
+# токен, и воркеры один раз перестраивают свои данные.
+VERSION_TIMEOUT = 24 * 60 * 60
+CHANGE_TIMEOUT = 24 * 60 * 60
+CHANGE_GRACE = 5
+PRUNE_EVERY = 100
+MAX_CHANGES = 1000
+
+
+def get_version(name):
+    """Текущая версия набора данных, общая для всех воркеров."""
+    return caches['coordination'].get_or_set(
+        VERSION_KEY.format(name), uuid4().hex, VERSION_TIMEOUT
+    )
+
+
+def bump_version(name):
+    """Смена версии: закэшированные в воркерах данные устаревают.
+    Используется случайный токен, а не счетчик, чтобы вытеснение
+    ключа из кэша не вернуло старое значение."""
+    caches['coordination'].set(
+        VERSION_KEY.format(name), uuid4().hex, VERSION_TIMEOUT
+    )
+
+
+def bump_version_on_commit(name):
+    """Смена версии после фиксации текущей транзакции, чтобы
+    параллельный запрос не закэшировал старые данные под новой
+    версией."""
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def log_changes(name, keys):
+    """Запись в общий журнал набора name: какие ключи изменились.
+    keys=None означает «изменилось все»."""
+    entry = ChangeLog.objects.create(
+        name=name, keys=None if keys is None else list(keys)
+    )
+    if entry.pk % PRUNE_EVERY == 0:
+        ChangeLog.objects.filter(
+            created__lt=entry.created - timedelta(seconds=CHANGE_TIMEOUT)
+        ).delete()
+
+
+def read_changes(name, since):
+    """
+    Номер записи журнала, с которой читать в следующий раз, и множество
+    ключей, изменившихся после записи since. Вместо множества
+    возвращается None, если часть журнала удалена или записей слишком
+    много — тогда данные нужно перестроить целиком.
+    id записи выдается до фиксации транзакции, поэтому запись с меньшим
+    id может стать видна позже. Записи моложе CHANGE_GRACE секунд
+    читаются и при следующем вызове; повторное применение безопасно.
+    """
+    horizon = timezone.now() - timedelta(seconds=CHANGE_GRACE)
+    entries = ChangeLog.objects.filter(name=name).order_by('pk')
+    if since is not None:
+        rows = list(entries.filter(pk__gte=since).values_list(
+            'pk', 'keys', 'created'
+        )[:MAX_CHANGES + 1])
+        if since and (not rows or rows[0][0] != since):
+            since = None
+        elif len(rows) <= MAX_CHANGES:
+            sequence, changed, settled = since, set(), True
+            for pk, keys, created in rows:
+                if pk == since:
+                    continue
+                if keys is None:
+                    changed = None
+                elif changed is not None:
+                    changed.update(keys)
+                settled = settled and created < horizon
+                if settled:
+                    sequence = pk
+            return sequence, changed
+    return entries.filter(created__lt=horizon).aggregate(
+        sequence=Coalesce(Max('pk'), 0)
+    )['sequence'], None
+
+
+class VersionedLRUCache:
+    """
+    LRU-кэш в памяти процесса. Записи действительны, пока не сменилась
+    общая версия набора данных name.
+    """
+
+    def __init__(self, name, maxsize=1024):
+        self.name = name
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get_or_set(self, key, default):
+        version = get_version(self.name)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == version:
+                self._data.move_to_end(key)
+                return entry[1]
+        with read_from_primary():
+            value = default()
+        with self._lock:
+            self._data[key] = (version, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
@@ -0,0 +1,97 @@
+import os
+from io import BytesIO
+from uuid import uuid4
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .cache import bump_version
+
+# Название варианта: наибольшая сторона в пикселях.
+VARIANTS = {
+    'thumbnail': 160,
+    'card': 640,
+    'full': 1600,
+}
+VARIANTS_DIR = 'recipes/variants'
+WEBP_QUALITY = 80
+
+
+def variant_path(recipe_id, image_name, variant, token):
+    """Путь варианта. token различает рендеры одного фото, чтобы новые
+    файлы не перезаписывали те, на которые еще ссылается рецепт."""
+    base = os.path.splitext(os.path.basename(image_name))[0]
+    return '{0}/{1}/{2}.{3}.{4}.webp'.format(
+        VARIANTS_DIR, recipe_id, base, token, variant
+    )
+
+
+def delete_variants(image_variants):
+    for path in image_variants.get('paths', {}).values():
+        default_storage.delete(path)
+
+
+def delete_variants_on_commit(image_variants):
+    """Удаление файлов вариантов после фиксации транзакции: при откате
+    рецепт по-прежнему на них ссылается."""
+    if image_variants.get('paths'):
+        transaction.on_commit(lambda: delete_variants(image_variants))
+
+
+def render_variants(image_file):
+    """Уменьшенные копии изображения в формате WebP."""
+    with Image.open(image_file) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert(
+            'RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB'
+        )
+        for variant, size in VARIANTS.items():
+            copy = image.copy()
+            copy.thumbnail((size, size), Image.LANCZOS)
+            buffer = BytesIO()
+            copy.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+            yield variant, ContentFile(buffer.getvalue())
+
+
+def make_image_variants(recipe_id):
+    """
+    Создание вариантов фото рецепта и сохранение их путей.
+    Новые файлы пишутся рядом со старыми, пути подменяются одним
+    UPDATE, а старые файлы удаляются после фиксации. Если фото
+    заменили, пока шел рендер, результат отбрасывается: сигнал
+    замены уже поставил задачу для нового фото.
+    """
+    from .models import Recipe
+
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None:
+        return
+    variants = {'source': recipe.image.name, 'paths': {}}
+    if recipe.image:
+        token = uuid4().hex[:8]
+        with recipe.image.open('rb') as image_file:
+            for variant, content in render_variants(image_file):
+                variants['paths'][variant] = default_storage.save(
+                    variant_path(
+                        recipe_id, recipe.image.name, variant, token
+                    ),
+                    content
+                )
+    try:
+        with transaction.atomic():
+            current = Recipe.objects.select_for_update().filter(
+                pk=recipe_id
+            ).values('image', 'image_variants').first()
+            if current is None or current['image'] != variants['source']:
+                delete_variants(variants)
+                return
+            Recipe.objects.filter(pk=recipe_id).touch(
+                image_variants=variants
+            )
+            delete_variants_on_commit(current['image_variants'])
+    except Exception:
+        delete_variants(variants)
+        raise
+    bump_version('recipes')
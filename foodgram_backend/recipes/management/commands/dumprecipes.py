@@ -0,0 +1,109 @@
+import base64
+import json
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import IngredientRecipe, Recipe
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_image(image):
+    if not image:
+        return None
+    try:
+        with image.open('rb') as file:
+            data = file.read()
+    except (OSError, ValueError):
+        return None
+    return {
+        'name': image.name.rsplit('/', 1)[-1],
+        'data': base64.b64encode(data).decode(),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты с ингредиентами, тегами, автором и фото '
+            'в формате NDJSON: одна строка — один рецепт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='-',
+            help='Путь к файлу (по умолчанию — stdout).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Количество рецептов, читаемых из курсора за раз.'
+        )
+        parser.add_argument(
+            '--no-images', action='store_true',
+            help='Не включать фото в выгрузку.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше 0.')
+        output = options['output']
+        file = (sys.stdout if output == '-'
+                else open(output, 'w', encoding='utf-8'))
+        count = 0
+        try:
+            # iterator() читает через серверный курсор на PostgreSQL,
+            # в памяти держится только текущая пачка.
+            recipes = Recipe.objects.select_related('author').order_by(
+                'id'
+            ).iterator(chunk_size=batch_size)
+            for batch in chunks(recipes, batch_size):
+                for record in self.serialize(batch, options['no_images']):
+                    file.write(json.dumps(record, ensure_ascii=False))
+                    file.write('\n')
+                count += len(batch)
+                self.stderr.write('  {0} выгружено'.format(count))
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        self.stderr.write(self.style.SUCCESS(
+            'done: выгружено {0}.'.format(count)
+        ))
+
+    @staticmethod
+    def serialize(recipes, no_images):
+        """Записи для пачки рецептов: по одному запросу на ингредиенты
+        и теги всей пачки."""
+        ids = [recipe.id for recipe in recipes]
+        ingredients = {recipe_id: [] for recipe_id in ids}
+        for recipe_id, name, unit, amount in IngredientRecipe.objects.filter(
+            recipe_id__in=ids
+        ).values_list(
+            'recipe_id', 'ingredient__name', 'ingredient__measurement_unit',
+            'amount'
+        ).order_by('id'):
+            ingredients[recipe_id].append(
+                {'name': name, 'measurement_unit': unit, 'amount': amount}
+            )
+        tags = {recipe_id: [] for recipe_id in ids}
+        for recipe_id, slug in Recipe.tags.through.objects.filter(
+            recipe_id__in=ids
+        ).values_list('recipe_id', 'tag__slug').order_by('id'):
+            tags[recipe_id].append(slug)
+        for recipe in recipes:
+            yield {
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+                'pub_date': recipe.pub_date.isoformat(),
+                'author': recipe.author.username,
+                'tags': tags[recipe.id],
+                'ingredients': ingredients[recipe.id],
+                'image': None if no_images else read_image(recipe.image),
+            }
@@ -0,0 +1,183 @@
+import random
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.cache import bump_version, log_changes
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+from .loadrecipes import insert_recipes
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+# Даты публикации отсчитываются от фиксированной даты, чтобы набор
+# с одним --seed не зависел от времени запуска.
+BASE_DATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+WORDS = (
+    'суп', 'салат', 'пирог', 'запеканка', 'рагу', 'паста', 'каша',
+    'омлет', 'плов', 'борщ', 'котлеты', 'блины', 'соус', 'десерт',
+)
+
+
+class Command(BaseCommand):
+    help = ('Генерирует воспроизводимый набор данных для нагрузочных '
+            'тестов: пользователей, рецепты, подписки, избранное '
+            'и корзины. Ингредиенты берутся из data/ingredients.csv.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument(
+            '--recipes-per-user', type=int, default=10,
+            help='Среднее число рецептов на пользователя.'
+        )
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Префикс имен создаваемых пользователей.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix + '_').exists():
+            raise CommandError(
+                'Пользователи с префиксом {0} уже есть, укажите '
+                'другой --prefix.'.format(prefix)
+            )
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        if not Ingredient.objects.exists():
+            call_command('importcsv', stdout=self.stdout)
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        tag_ids = self.create_tags()
+        with transaction.atomic():
+            user_ids = self.create_users(prefix, options['users'])
+            recipe_ids = self.create_recipes(
+                user_ids, ingredient_ids, tag_ids,
+                options['recipes_per_user'],
+            )
+            self.create_links(
+                Follow, 'author', user_ids, user_ids,
+                options['follows_per_user'], exclude_self=True,
+            )
+            self.create_links(
+                Favorite, 'recipe', user_ids, recipe_ids,
+                options['favorites_per_user'],
+            )
+            self.create_links(
+                ShoppingCart, 'recipe', user_ids, recipe_ids,
+                options['carts_per_user'],
+            )
+        # bulk_create не отправляет сигналы: производные данные
+        # пересчитываются целиком.
+        call_command('recountcounters', stdout=self.stdout)
+        call_command('rebuildshoppinglists', stdout=self.stdout)
+        call_command('rebuildtimelines', stdout=self.stdout)
+        bump_version('recipes')
+        log_changes('pantry', None)
+        self.stdout.write(self.style.SUCCESS(
+            'done: пользователей {0}, рецептов {1}.'.format(
+                len(user_ids), len(recipe_ids)
+            )
+        ))
+
+    def create_tags(self):
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self, prefix, count):
+        # Хэш пароля считается один раз: это самая медленная часть.
+        password = make_password('{0}-password'.format(prefix))
+        User.objects.bulk_create((
+            User(
+                username='{0}_{1}'.format(prefix, number),
+                email='{0}_{1}@example.com'.format(prefix, number),
+                first_name='Имя{0}'.format(number),
+                last_name='Фамилия{0}'.format(number),
+                password=password,
+            ) for number in range(count)
+        ), batch_size=self.batch_size)
+        return list(User.objects.filter(
+            username__startswith=prefix + '_'
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, user_ids, ingredient_ids, tag_ids, per_user):
+        rng = self.rng
+        recipe_ids = []
+        batch = []
+        for author_id in user_ids:
+            for _ in range(rng.randint(0, 2 * per_user)):
+                recipe = Recipe(
+                    author_id=author_id,
+                    name='{0} {1}'.format(
+                        rng.choice(WORDS), rng.randint(1, 10 ** 6)
+                    ),
+                    text=' '.join(rng.choices(WORDS, k=30)),
+                    cooking_time=rng.randint(5, 180),
+                    pub_date=BASE_DATE - timedelta(
+                        seconds=rng.randint(0, 365 * 24 * 60 * 60)
+                    ),
+                )
+                batch.append((
+                    recipe,
+                    rng.sample(ingredient_ids, rng.randint(5, 20)),
+                    rng.sample(tag_ids, rng.randint(1, len(tag_ids))),
+                ))
+                if len(batch) >= self.batch_size:
+                    recipe_ids += self.flush_recipes(batch)
+        recipe_ids += self.flush_recipes(batch)
+        return recipe_ids
+
+    def flush_recipes(self, batch):
+        if not batch:
+            return []
+        rng = self.rng
+        insert_recipes([recipe for recipe, _, _ in batch])
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(
+                recipe_id=recipe.id, ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe, ingredients, _ in batch
+            for ingredient_id in ingredients
+        ], batch_size=self.batch_size)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, _, tags in batch for tag_id in tags
+        ], batch_size=self.batch_size)
+        ids = [recipe.id for recipe, _, _ in batch]
+        self.stdout.write('  рецептов: +{0}'.format(len(ids)))
+        batch.clear()
+        return ids
+
+    def create_links(self, model, field, user_ids, target_ids, per_user,
+                     exclude_self=False):
+        rng = self.rng
+        links = []
+        for user_id in user_ids:
+            count = min(rng.randint(0, 2 * per_user), len(target_ids))
+            for target_id in rng.sample(target_ids, count):
+                if exclude_self and target_id == user_id:
+                    continue
+                links.append(model(
+                    user_id=user_id, **{'{0}_id'.format(field): target_id}
+                ))
+        model.objects.bulk_create(links, batch_size=self.batch_size)
+        self.stdout.write('  {0}: {1}'.format(model.__name__, len(links)))
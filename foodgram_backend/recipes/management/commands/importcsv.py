@@ -1,35 +1,101 @@
 import csv
+import json
+import os
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.cache import bump_version
 from recipes.models import Ingredient
 
+DEFAULT_FILE = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+HEADER = ('name', 'measurement_unit')
+
 
 class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV или JSON. Добавляются только '
+            'отсутствующие пары (название, единица измерения), '
+            'существующие записи и рецепты не затрагиваются.')
 
-    def handle(self, *args, **options):
-        self.stdout.write('seeding data...')
-        Command.run_seed()
-        self.stdout.write('done.')
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default=DEFAULT_FILE,
+            help='Путь к файлу .csv или .json с ингредиентами.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество записей в одном INSERT.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать изменения, ничего не записывая.'
+        )
 
-    @staticmethod
-    def clear_data():
-        """Удаление всех данных из таблицы Ингредиенты"""
-        print('Clear data started')
-        Ingredient.objects.all().delete()
+    def handle(self, *args, **options):
+        path = options['file']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше 0.')
+        if not os.path.exists(path):
+            raise CommandError('Файл {0} не найден.'.format(path))
+        self.stdout.write('seeding data from {0}...'.format(path))
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        seen = set()
+        batch = []
+        stats = {'read': 0, 'created': 0}
+        with transaction.atomic():
+            for key in self.read_rows(path):
+                stats['read'] += 1
+                if key in existing or key in seen:
+                    continue
+                seen.add(key)
+                batch.append(
+                    Ingredient(name=key[0], measurement_unit=key[1])
+                )
+                if len(batch) >= batch_size:
+                    self.flush(batch, stats, options['dry_run'])
+            self.flush(batch, stats, options['dry_run'])
+        if stats['created'] and not options['dry_run']:
+            bump_version('ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            '{0}: прочитано {1}, {2} {3}, уже были в базе {4}.'.format(
+                'dry run' if options['dry_run'] else 'done',
+                stats['read'],
+                'будет добавлено' if options['dry_run'] else 'добавлено',
+                stats['created'],
+                stats['read'] - stats['created'],
+            )
+        ))
 
-    @staticmethod
-    def run_seed():
-        Command.clear_data()
-        Command.seed_ingredients()
+    def flush(self, batch, stats, dry_run):
+        if not batch:
+            return
+        if not dry_run:
+            Ingredient.objects.bulk_create(batch)
+        stats['created'] += len(batch)
+        self.stdout.write(
+            '  {0} прочитано, {1} новых'.format(
+                stats['read'], stats['created']
+            )
+        )
+        batch.clear()
 
     @staticmethod
-    def seed_ingredients():
-        print('Seed ingredients started')
-        with open('data/ingredients.csv') as file:
-            reader = csv.reader(file)
-            next(reader)
-            for row in reader:
-                print(row)
-                ingredient = Ingredient(name=row[0], measurement_unit=row[1])
-                ingredient.save()
+    def read_rows(path):
+        """Пары (название, единица измерения) из файла.
+        CSV читается построчно, JSON — целиком."""
+        with open(path, encoding='utf-8') as file:
+            if path.endswith('.json'):
+                rows = (
+                    (item['name'], item['measurement_unit'])
+                    for item in json.load(file)
+                )
+            else:
+                rows = (tuple(row[:2]) for row in csv.reader(file) if row)
+            for name, measurement_unit in rows:
+                key = (name.strip(), measurement_unit.strip())
+                if key != HEADER:
+                    yield key
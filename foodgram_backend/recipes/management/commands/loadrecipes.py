@@ -0,0 +1,171 @@
+import base64
+import json
+import os
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from recipes.cache import bump_version, log_changes
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+from .dumprecipes import chunks
+
+
+def close_connections():
+    # Дочерний процесс не должен использовать соединение родителя.
+    connections.close_all()
+
+
+def save_image(image):
+    if not image:
+        return ''
+    field = Recipe._meta.get_field('image')
+    name = field.generate_filename(None, image['name'])
+    return field.storage.save(
+        name, ContentFile(base64.b64decode(image['data']))
+    )
+
+
+def insert_recipes(recipes):
+    if connection.features.can_return_rows_from_bulk_insert:
+        dates = [recipe.pub_date for recipe in recipes]
+        Recipe.objects.bulk_create(recipes)
+        # auto_now_add перезаписывает дату публикации при вставке.
+        for recipe, pub_date in zip(recipes, dates):
+            recipe.pub_date = pub_date
+        Recipe.objects.bulk_update(recipes, ['pub_date'])
+        return
+    # Django 3.2 на SQLite не возвращает id из bulk_create.
+    for recipe in recipes:
+        recipe.save_base(raw=True)
+
+
+def load_batch(records):
+    """Загрузка пачки рецептов. Авторы, теги и ингредиенты ищутся
+    одним запросом на пачку; рецепты с неизвестными ссылками
+    пропускаются. Возвращает (загружено, пропущено)."""
+    authors = dict(User.objects.filter(
+        username__in={record['author'] for record in records}
+    ).values_list('username', 'id'))
+    tags = dict(Tag.objects.filter(
+        slug__in={slug for record in records for slug in record['tags']}
+    ).values_list('slug', 'id'))
+    ingredients = {
+        (name, unit): pk for pk, name, unit in Ingredient.objects.filter(
+            name__in={
+                item['name']
+                for record in records for item in record['ingredients']
+            }
+        ).values_list('id', 'name', 'measurement_unit')
+    }
+    loaded = []
+    for record in records:
+        author_id = authors.get(record['author'])
+        tag_ids = [tags.get(slug) for slug in record['tags']]
+        amounts = [
+            (ingredients.get((item['name'], item['measurement_unit'])),
+             item['amount'])
+            for item in record['ingredients']
+        ]
+        if (author_id is None or None in tag_ids
+                or any(pk is None for pk, _ in amounts)):
+            continue
+        recipe = Recipe(
+            author_id=author_id,
+            name=record['name'],
+            text=record['text'],
+            cooking_time=record['cooking_time'],
+            pub_date=(parse_datetime(record.get('pub_date') or '')
+                      or timezone.now()),
+            image=save_image(record.get('image')),
+        )
+        loaded.append((recipe, tag_ids, amounts))
+    with transaction.atomic():
+        insert_recipes([recipe for recipe, _, _ in loaded])
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(
+                recipe_id=recipe.id, ingredient_id=pk, amount=amount
+            )
+            for recipe, _, amounts in loaded for pk, amount in amounts
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, tag_ids, _ in loaded for tag_id in tag_ids
+        ])
+        # bulk_create не отправляет post_save: счетчики обновляются здесь.
+        per_author = Counter(recipe.author_id for recipe, _, _ in loaded)
+        for author_id, count in per_author.items():
+            User.objects.filter(pk=author_id).update(
+                recipes_count=F('recipes_count') + count
+            )
+    return len(loaded), len(records) - len(loaded)
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из NDJSON, созданного dumprecipes. '
+            'Авторы, теги и ингредиенты должны уже существовать.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Путь к файлу .ndjson.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Количество рецептов в одной транзакции.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Количество процессов (по умолчанию — число ядер).'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше 0.')
+        try:
+            file = open(options['file'], encoding='utf-8')
+        except OSError as error:
+            raise CommandError(error)
+        workers = options['workers'] or os.cpu_count()
+        close_connections()
+        loaded = skipped = 0
+        with file, ProcessPoolExecutor(
+            max_workers=workers, initializer=close_connections
+        ) as pool:
+            # Файл читается по мере обработки: в очереди не больше
+            # двух пачек на процесс, память не растет с размером файла.
+            limit = 2 * workers
+            pending = set()
+            records = (json.loads(line) for line in file if line.strip())
+            for batch in chunks(records, batch_size):
+                if len(pending) >= limit:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    loaded, skipped = self.collect(done, loaded, skipped)
+                pending.add(pool.submit(load_batch, batch))
+            loaded, skipped = self.collect(wait(pending)[0], loaded, skipped)
+        if loaded:
+            bump_version('recipes')
+            log_changes('pantry', None)
+        self.stdout.write(self.style.SUCCESS(
+            'done: загружено {0}, пропущено {1}.'.format(loaded, skipped)
+        ))
+        if loaded:
+            self.stdout.write(
+                'WebP-варианты фото: python manage.py makeimagevariants\n'
+                'Ленты подписок: python manage.py rebuildtimelines'
+            )
+
+    def collect(self, futures, loaded, skipped):
+        for future in futures:
+            batch_loaded, batch_skipped = future.result()
+            loaded += batch_loaded
+            skipped += batch_skipped
+        self.stdout.write('  {0} загружено, {1} пропущено'.format(
+            loaded, skipped
+        ))
+        return loaded, skipped
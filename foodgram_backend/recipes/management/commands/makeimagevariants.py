@@ -0,0 +1,57 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from recipes.images import make_image_variants
+from recipes.models import Recipe
+
+
+def process(recipe_id):
+    make_image_variants(recipe_id)
+    return recipe_id
+
+
+def close_connections():
+    # Дочерний процесс не должен использовать соединение родителя.
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Создает WebP-варианты фото для существующих рецептов '
+            'в нескольких процессах.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Количество процессов (по умолчанию — число ядер).'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать варианты и для уже обработанных рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['force']:
+            recipes = recipes.filter(image_variants={})
+        ids = list(recipes.values_list('pk', flat=True))
+        self.stdout.write('recipes to process: {0}'.format(len(ids)))
+        close_connections()
+        done = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=close_connections
+        ) as pool:
+            futures = {pool.submit(process, pk): pk for pk in ids}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write('recipe {0}: {1}'.format(
+                        futures[future], error
+                    ))
+        self.stdout.write(self.style.SUCCESS(
+            'done: {0}, failed: {1}'.format(done, failed)
+        ))
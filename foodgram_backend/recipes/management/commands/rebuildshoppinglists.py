@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import AMOUNT_EPSILON, ShoppingListIngredient
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает списки покупок по корзинам пользователей '
+            'или проверяет их расхождение с корзинами (--verify).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только сравнить сохраненные суммы с корзинами.'
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+        else:
+            self.rebuild()
+
+    def rebuild(self):
+        with transaction.atomic():
+            ShoppingListIngredient.objects.all().delete()
+            ShoppingListIngredient.objects.bulk_create(
+                (ShoppingListIngredient(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    amount=total
+                ) for user_id, ingredient_id, total
+                    in ShoppingListIngredient.objects.live_totals()),
+                batch_size=1000,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Списки покупок пересчитаны: {0} строк.'.format(
+                ShoppingListIngredient.objects.count()
+            )
+        ))
+
+    def verify(self):
+        expected = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total
+            in ShoppingListIngredient.objects.live_totals()
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListIngredient.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+        drift = [
+            (key, stored.get(key, 0), expected.get(key, 0))
+            for key in expected.keys() | stored.keys()
+            if abs(stored.get(key, 0) - expected.get(key, 0))
+            > AMOUNT_EPSILON
+        ]
+        for (user_id, ingredient_id), actual, total in sorted(drift):
+            self.stdout.write(
+                'user={0} ingredient={1}: сохранено {2}, в корзине {3}'
+                .format(user_id, ingredient_id, actual, total)
+            )
+        if drift:
+            raise CommandError(
+                'Расхождений в списках покупок: {0}.'.format(len(drift))
+            )
+        self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import TimelineEntry
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = ('Заново заполняет ленты подписок по текущим подпискам. '
+            'Нужна после массовой загрузки рецептов или подписок.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            user_id = None
+            authors = []
+            for follower, author in Follow.objects.order_by(
+                'user_id'
+            ).values_list('user_id', 'author_id').iterator():
+                if follower != user_id and authors:
+                    TimelineEntry.objects.backfill(user_id, authors)
+                    authors = []
+                user_id = follower
+                authors.append(author)
+            if authors:
+                TimelineEntry.objects.backfill(user_id, authors)
+        self.stdout.write(self.style.SUCCESS(
+            'Ленты пересобраны: {0} записей.'.format(
+                TimelineEntry.objects.count()
+            )
+        ))
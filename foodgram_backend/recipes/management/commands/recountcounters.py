@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+# (модель со счетчиком, поле счетчика, модель связи, поле ссылки)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def actual_count(related, field):
+    """Подзапрос с фактическим количеством связанных записей."""
+    return Coalesce(Subquery(
+        related.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = ('Сверяет денормализованные счетчики рецептов и пользователей '
+            'с фактическими данными и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать количество расхождений.'
+        )
+
+    def handle(self, *args, **options):
+        for model, counter, related, field in COUNTERS:
+            with transaction.atomic():
+                drift = model.objects.annotate(
+                    actual=actual_count(related, field)
+                ).exclude(**{counter: F('actual')})
+                ids = list(drift.values_list('pk', flat=True))
+                if ids and not options['dry_run']:
+                    model.objects.filter(pk__in=ids).update(
+                        **{counter: actual_count(related, field)}
+                    )
+            self.stdout.write('{0}.{1}: расхождений {2}'.format(
+                model.__name__, counter, len(ids)
+            ))
+        self.stdout.write(self.style.SUCCESS('done.'))
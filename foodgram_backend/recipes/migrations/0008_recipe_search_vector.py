@@ -0,0 +1,64 @@
+# Generated by Django 3.2.3 on 2026-10-18 17:02
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+VECTOR = (
+    "setweight(to_tsvector('russian', coalesce({0}name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce({0}text, '')), 'B')"
+)
+
+CREATE_SQL = (
+    """
+    CREATE FUNCTION recipes_recipe_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {0};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """.format(VECTOR.format('NEW.')),
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update();
+    """,
+    'UPDATE recipes_recipe SET search_vector = {0};'.format(VECTOR.format('')),
+    'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+    'USING gin (search_vector);',
+)
+
+DROP_SQL = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx;',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe;',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update();',
+)
+
+
+def run_on_postgresql(statements):
+    """Триггер и GIN-индекс есть только в PostgreSQL,
+    на остальных базах поиск работает через LIKE."""
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_on_postgresql(CREATE_SQL), run_on_postgresql(DROP_SQL)
+        ),
+    ]
@@ -1,8 +1,16 @@
 from colorfield.fields import ColorField
-from django.db import models
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connections, models, transaction
+from django.db.models import (Exists, F, OuterRef, Prefetch, Sum, Value,
+                              Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from django.core.validators import MinValueValidator, RegexValidator
 
-from users.models import User
+from users.models import DerivedFieldsMixin, Follow, User
+
+AMOUNT_EPSILON = 1e-6
 
 
 class Tag(models.Model):
@@ -60,7 +68,70 @@ class Ingredient(models.Model):
         verbose_name_plural = 'Ингредиенты'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """
+    Выборка рецептов для чтения.
+    """
+
+    def with_related(self):
+        """Подгрузка автора, тэгов и ингредиентов фиксированным числом
+        запросов. search_vector нужен только в WHERE и не читается."""
+        return self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_in_recipe',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def touch(self, **fields):
+        """Новая версия рецептов (вместе с обновлением fields): их
+        фрагменты в кэше устаревают. Версия меняется только здесь."""
+        return self.update(version=F('version') + 1, **fields)
+
+    def with_user_flags(self, user):
+        """Аннотация флагов избранного, корзины и подписки на автора
+        для пользователя."""
+        if not user or user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()),
+                author_is_subscribed=Value(
+                    False, output_field=models.BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author'))),
+        )
+
+    def first_per_author(self, authors, limit):
+        """Первые limit рецептов каждого автора одним запросом
+        с ROW_NUMBER() OVER (PARTITION BY author)."""
+        ranked = self.model.objects.filter(author__in=authors).annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )
+        ).order_by().values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            'WHERE ranked.row_number <= %s',
+            (*params, limit),
+        ))
+
+
+class Recipe(DerivedFieldsMixin, models.Model):
     """
     Модель рецептов.
     """
@@ -81,6 +152,9 @@ class Recipe(models.Model):
     image = models.ImageField(blank=True,
                               upload_to='recipes/images',
                               verbose_name='Фото рецепта')
+    image_variants = models.JSONField(default=dict, blank=True,
+                                      editable=False,
+                                      verbose_name='Варианты фото')
     tags = models.ManyToManyField(Tag,
                                   blank=False,
                                   verbose_name='Тэги рецепта')
@@ -92,15 +166,38 @@ class Recipe(models.Model):
             1, message='Время не должно быть менее 1 минуты!')],
         verbose_name='Время приготовления'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В избранном')
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В списках покупок')
+    # Меняется при любом изменении данных фрагмента рецепта
+    # (см. RecipeQuerySet.touch и recipes/signals.py).
+    version = models.PositiveIntegerField(
+        default=1, editable=False, verbose_name='Версия')
+    # Заполняется триггером PostgreSQL, GIN-индекс создан в миграции 0008.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+    derived_fields = (
+        'favorites_count', 'in_carts_count', 'version', 'image_variants'
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [models.Index(
+            fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+        )]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Счетчики обновляются в post_save в той же транзакции.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class IngredientRecipe(models.Model):
     """Количество ингредиентов в блюде.
@@ -156,6 +253,10 @@ class Favorite(models.Model):
         constraints = [models.UniqueConstraint(
             fields=['recipe', 'user'], name='unique_favorite')]
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class ShoppingCart(models.Model):
     """
@@ -183,3 +284,245 @@ class ShoppingCart(models.Model):
         constraints = [models.UniqueConstraint(
             fields=['user', 'recipe'], name='unique_shopping_cart'
         )]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    """
+    Изменение суммарного списка покупок на разницу количеств.
+    """
+
+    @staticmethod
+    def recipe_amounts(recipe_id):
+        """Количество каждого ингредиента в рецепте."""
+        return dict(IngredientRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount'))
+
+    @staticmethod
+    def live_totals(users=None):
+        """Суммы ингредиентов, посчитанные по корзинам заново."""
+        if users is None:
+            lookup = {'recipe__shopping_cart__user__isnull': False}
+        else:
+            lookup = {'recipe__shopping_cart__user__in': users}
+        return IngredientRecipe.objects.filter(**lookup).values_list(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+
+    def _upsert_amounts(self, users, amounts):
+        """
+        Прибавление amounts ({ingredient_id: delta}) к спискам покупок
+        пользователей из подзапроса users (колонка user_id) одним
+        INSERT ... ON CONFLICT DO UPDATE: параллельные добавления
+        одного нового ингредиента не упираются в уникальность
+        (user, ingredient).
+        """
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not amounts:
+            return
+        users_sql, users_params = users.query.get_compiler(
+            self.db
+        ).as_sql()
+        table = connections[self.db].ops.quote_name(
+            self.model._meta.db_table
+        )
+        delta_sql = ' UNION ALL '.join(
+            ['SELECT %s AS ingredient_id, %s AS amount'] * len(amounts)
+        )
+        delta_params = [
+            value for item in amounts.items() for value in item
+        ]
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                # WHERE 1 = 1 нужен SQLite для разбора ON CONFLICT
+                # после INSERT ... SELECT.
+                cursor.execute(
+                    'INSERT INTO {0} (user_id, ingredient_id, amount) '
+                    'SELECT users.user_id, delta.ingredient_id, delta.amount '
+                    'FROM ({1}) AS users, ({2}) AS delta WHERE 1 = 1 '
+                    'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                    'SET amount = {0}.amount + EXCLUDED.amount'.format(
+                        table, users_sql, delta_sql
+                    ),
+                    [*users_params, *delta_params],
+                )
+            self.filter(
+                user__in=users, amount__lte=AMOUNT_EPSILON
+            ).delete()
+
+    def add_amounts(self, user_id, amounts):
+        """Прибавление amounts ({ingredient_id: delta}) к списку
+        покупок пользователя."""
+        self._upsert_amounts(
+            User.objects.filter(pk=user_id).annotate(
+                user_id=F('id')
+            ).order_by().values('user_id'),
+            amounts,
+        )
+
+    def subtract_amounts(self, user_id, amounts):
+        self.add_amounts(
+            user_id,
+            {ingredient_id: -amount
+             for ingredient_id, amount in amounts.items()}
+        )
+
+    def add_amounts_for_recipe(self, recipe_id, amounts):
+        """Прибавление amounts к спискам покупок всех пользователей,
+        у которых рецепт в корзине, без запроса на каждого."""
+        self._upsert_amounts(
+            ShoppingCart.objects.filter(
+                recipe_id=recipe_id
+            ).order_by().values('user_id'),
+            amounts,
+        )
+
+
+class ShoppingListIngredient(models.Model):
+    """
+    Суммарное количество ингредиента в корзине пользователя.
+    Поддерживается инкрементально при изменении корзины и рецептов.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.FloatField(verbose_name='Количество')
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        default_related_name = 'shopping_list'
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'ingredient'], name='unique_shopping_list'
+        )]
+
+    def __str__(self):
+        return f"{self.user}: {self.ingredient} – {self.amount}"
+
+
+class TimelineQuerySet(models.QuerySet):
+    """
+    Ленты подписок с раскладкой при записи. Рецепты авторов, у которых
+    не меньше FEED_PULL_FOLLOWERS подписчиков, в ленты не раскладываются,
+    а читаются при запросе ленты.
+    """
+
+    @staticmethod
+    def pushed_authors(author_ids):
+        return User.objects.filter(
+            pk__in=author_ids,
+            followers_count__lt=settings.FEED_PULL_FOLLOWERS,
+        ).values('pk')
+
+    def fan_out(self, recipe):
+        """Новый рецепт — в ленты всех подписчиков автора."""
+        if recipe.author.followers_count >= settings.FEED_PULL_FOLLOWERS:
+            return
+        self.bulk_create((
+            self.model(
+                user_id=user_id, recipe_id=recipe.id,
+                author_id=recipe.author_id, pub_date=recipe.pub_date,
+            ) for user_id in Follow.objects.filter(
+                author_id=recipe.author_id
+            ).values_list('user_id', flat=True).iterator()
+        ), batch_size=1000, ignore_conflicts=True)
+
+    def backfill(self, user_id, author_ids):
+        """Последние FEED_BACKFILL_LIMIT рецептов авторов — в ленту
+        пользователя после подписки."""
+        self.bulk_create((
+            self.model(
+                user_id=user_id, recipe_id=recipe_id,
+                author_id=author_id, pub_date=pub_date,
+            ) for recipe_id, author_id, pub_date
+            in Recipe.objects.first_per_author(
+                self.pushed_authors(author_ids),
+                settings.FEED_BACKFILL_LIMIT,
+            ).values_list('id', 'author_id', 'pub_date').order_by()
+        ), batch_size=1000, ignore_conflicts=True)
+
+    def backfill_followers(self, author_id):
+        """Рецепты автора — в ленты всех его подписчиков. Нужна, когда
+        у автора стало меньше FEED_PULL_FOLLOWERS подписчиков
+        и его рецепты перестали читаться при запросе ленты."""
+        for user_id in Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True).iterator():
+            self.backfill(user_id, [author_id])
+
+    def trim(self, user_id, author_ids):
+        """Удаление рецептов авторов из ленты после отписки."""
+        self.filter(user_id=user_id, author_id__in=author_ids).delete()
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Автор рецепта'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    objects = TimelineQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'recipe'], name='unique_timeline_entry'
+        )]
+        indexes = [models.Index(
+            fields=['user', '-pub_date', '-recipe'],
+            name='timeline_user_pub_date_idx'
+        )]
+
+
+class ChangeLog(models.Model):
+    """
+    Журнал изменений наборов данных для индексов в памяти воркеров.
+    Автоинкрементный id служит общим атомарным номером записи.
+    """
+
+    name = models.CharField(max_length=50, verbose_name='Набор данных')
+    keys = models.JSONField(
+        null=True, verbose_name='Изменившиеся ключи',
+        help_text='Пусто, если изменилось все.'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name='Время изменения'
+    )
+
+    class Meta:
+        verbose_name = 'Запись журнала изменений'
+        verbose_name_plural = 'Журнал изменений'
+        indexes = [models.Index(
+            fields=['name', 'id'], name='changelog_name_id_idx'
+        )]
@@ -0,0 +1,166 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from jobs.registry import enqueue
+from users.models import Follow, User
+from .cache import bump_version_on_commit, log_changes
+from .images import delete_variants_on_commit
+from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, ShoppingListIngredient, Tag, TimelineEntry)
+
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingCart: (Recipe, 'recipe_id', 'in_carts_count'),
+    Follow: (User, 'author_id', 'followers_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+}
+
+
+def bump_recipes_version():
+    bump_version_on_commit('recipes')
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListIngredient.objects.add_amounts(
+            instance.user_id,
+            ShoppingListIngredient.objects.recipe_amounts(instance.recipe_id)
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_recipe_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListIngredient.objects.subtract_amounts(
+        instance.user_id,
+        ShoppingListIngredient.objects.recipe_amounts(instance.recipe_id)
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    bump_version_on_commit('ingredients')
+    bump_recipes_version()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    bump_version_on_commit('tags')
+    bump_recipes_version()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_changed(sender, instance, created=False, raw=False, **kwargs):
+    bump_recipes_version()
+    if sender is IngredientRecipe:
+        Recipe.objects.filter(pk=instance.recipe_id).touch()
+    elif not created and not raw and kwargs['signal'] is post_save:
+        Recipe.objects.filter(pk=instance.pk).touch()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    # Для инкрементального обновления индекса «что приготовить».
+    recipe_id = instance.pk if sender is Recipe else instance.recipe_id
+    transaction.on_commit(lambda: log_changes('pantry', [recipe_id]))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action.startswith('post_'):
+        bump_recipes_version()
+        if not reverse:
+            Recipe.objects.filter(pk=instance.pk).touch()
+        elif pk_set:
+            Recipe.objects.filter(pk__in=pk_set).touch()
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None,
+                   **kwargs):
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_recipes_version()
+        if not created:
+            Recipe.objects.filter(author=instance).touch()
+
+
+def change_counter(sender, instance, delta):
+    model, attname, field = COUNTERS[sender]
+    model.objects.filter(pk=getattr(instance, attname)).update(
+        **{field: F(field) + delta}
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=Recipe)
+def increment_counter(sender, instance, created, raw=False, **kwargs):
+    # raw: загрузка фикстур и loadrecipes пересчитывают счетчики сами.
+    if created and not raw:
+        change_counter(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=Recipe)
+def decrement_counter(sender, instance, **kwargs):
+    change_counter(sender, instance, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.image_variants.get('source') != instance.image.name:
+        enqueue('recipes.image_variants', instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(sender, instance, **kwargs):
+    # Отложенное поле у удаленной строки уже не загрузить.
+    if 'image_variants' not in instance.get_deferred_fields():
+        delete_variants_on_commit(instance.image_variants)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_fan_out(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        TimelineEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        TimelineEntry.objects.backfill(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    unfollow(instance.user_id, [instance.author_id])
+
+
+def unfollow(user_id, author_ids):
+    """Очистка ленты после отписки. Если у автора стало меньше
+    FEED_PULL_FOLLOWERS подписчиков, его рецепты раскладываются
+    в ленты оставшихся подписчиков в фоне."""
+    TimelineEntry.objects.trim(user_id, author_ids)
+    for author_id in User.objects.filter(
+        pk__in=author_ids,
+        followers_count=settings.FEED_PULL_FOLLOWERS - 1,
+    ).values_list('pk', flat=True):
+        enqueue('recipes.timeline_backfill', author_id)
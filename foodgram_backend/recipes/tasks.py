@@ -0,0 +1,14 @@
+from jobs.registry import task
+
+from .images import make_image_variants
+from .models import TimelineEntry
+
+
+@task('recipes.image_variants')
+def image_variants(recipe_id):
+    make_image_variants(recipe_id)
+
+
+@task('recipes.timeline_backfill')
+def timeline_backfill(author_id):
+    TimelineEntry.objects.backfill_followers(author_id)
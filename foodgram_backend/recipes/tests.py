@@ -0,0 +1,96 @@
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from users.models import User
+from . import images
+from .models import Recipe
+
+
+def png(color):
+    buffer = BytesIO()
+    Image.new('RGB', (32, 32), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name='photo.png')
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class ImageVariantsTests(TestCase):
+    """Варианты фото: замена путей и удаление старых файлов."""
+
+    def setUp(self):
+        author = User.objects.create_user(
+            username='author', email='author@mail.ru', password='pass',
+            first_name='Автор', last_name='Автор',
+        )
+        self.recipe = Recipe.objects.create(
+            author=author, name='Суп', text='Текст', cooking_time=5,
+            image=png('red'),
+        )
+
+    def paths(self):
+        return Recipe.objects.get(
+            pk=self.recipe.pk
+        ).image_variants.get('paths', {}).values()
+
+    def make_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            images.make_image_variants(self.recipe.pk)
+        return list(self.paths())
+
+    def test_old_variants_deleted_after_swap(self):
+        old = self.make_variants()
+        self.assertTrue(all(map(default_storage.exists, old)))
+        self.recipe.image = png('blue')
+        self.recipe.save()
+        new = self.make_variants()
+        self.assertFalse(set(old) & set(new))
+        self.assertTrue(all(map(default_storage.exists, new)))
+        self.assertFalse(any(map(default_storage.exists, old)))
+
+    def files(self):
+        return set(default_storage.listdir(
+            '{0}/{1}'.format(images.VARIANTS_DIR, self.recipe.pk)
+        )[1])
+
+    def test_image_replaced_during_render(self):
+        old = self.make_variants()
+        files = self.files()
+        render = images.render_variants
+        rendered = []
+
+        def replace_image(image_file):
+            for variant, content in render(image_file):
+                rendered.append(variant)
+                yield variant, content
+            Recipe.objects.filter(pk=self.recipe.pk).update(
+                image='recipes/images/other.png'
+            )
+
+        with mock.patch.object(images, 'render_variants', replace_image):
+            self.assertEqual(self.make_variants(), old)
+        self.assertTrue(rendered)
+        self.assertTrue(all(map(default_storage.exists, old)))
+        self.assertEqual(self.files(), files)
+
+    def test_failed_render_keeps_old_variants(self):
+        old = self.make_variants()
+
+        def broken(image_file):
+            raise OSError('broken image')
+            yield
+
+        with mock.patch.object(images, 'render_variants', broken):
+            with self.assertRaises(OSError):
+                self.make_variants()
+        self.assertEqual(list(self.paths()), old)
+        self.assertTrue(all(map(default_storage.exists, old)))
+
+    def test_variants_deleted_with_recipe(self):
+        paths = self.make_variants()
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(pk=self.recipe.pk).delete()
+        self.assertFalse(any(map(default_storage.exists, paths)))
@@ -1,10 +1,35 @@
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 
-from django.db import models
+from django.db import models, transaction
 
 
-class User(AbstractUser):
+class DerivedFieldsMixin:
+    """
+    Поля derived_fields меняются только запросами UPDATE: через F()
+    в сигналах, командой recountcounters и фоновыми задачами. Обычное
+    сохранение их не записывает: иначе устаревший экземпляр затрет
+    чужие изменения.
+    """
+
+    derived_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            # Как и Django, отложенные поля не сохраняются.
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.derived_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(DerivedFieldsMixin, AbstractUser):
     """Модель пользователя с правами пользователя и администратора"""
     username = models.CharField(max_length=150, unique=True,
                                 validators=[UnicodeUsernameValidator()],
@@ -12,6 +37,11 @@ class User(AbstractUser):
     email = models.EmailField(unique=True, verbose_name="E-mail")
     first_name = models.CharField(max_length=150, verbose_name="Имя")
     last_name = models.CharField(max_length=150, verbose_name="Фамилия")
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Рецептов")
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Подписчиков")
+    derived_fields = ("recipes_count", "followers_count")
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
 
@@ -41,3 +71,8 @@ class Follow(models.Model):
             models.UniqueConstraint(
                 fields=["user", "author"], name="unique_follow"),
         ]
+
+    def save(self, *args, **kwargs):
+        # Счетчик подписчиков обновляется в post_save в той же транзакции.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
@@ -0,0 +1,35 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.cache import bump_version_on_commit
+from .models import User
+
+AUTH_VERSION = 'auth:{0}'
+
+
+def reset_auth_cache(user_id):
+    """Сброс закэшированных токенов пользователя во всех процессах
+    после фиксации транзакции: иначе параллельный запрос успеет
+    закэшировать старые данные под новой версией."""
+    if user_id is not None:
+        bump_version_on_commit(AUTH_VERSION.format(user_id))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Вход обновляет только last_login, кэш токенов от него не зависит.
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        reset_auth_cache(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Token)
+def auth_deleted(sender, instance, **kwargs):
+    reset_auth_cache(instance.pk if sender is User else instance.user_id)
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    reset_auth_cache(getattr(user, 'pk', None))
@@ -0,0 +1,42 @@
+from django.test import TestCase
+
+from recipes.models import Favorite, Recipe
+from .models import Follow, User
+
+
+class DerivedCountersTests(TestCase):
+    """Сохранение устаревшего экземпляра не затирает счетчики."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@mail.ru', password='pass',
+            first_name='Автор', last_name='Автор',
+        )
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@mail.ru', password='pass',
+            first_name='Читатель', last_name='Читатель',
+        )
+
+    def test_stale_user_save_keeps_followers_count(self):
+        stale = User.objects.get(pk=self.author.pk)
+        Follow.objects.create(user=self.reader, author=self.author)
+        stale.set_password('new-password')
+        stale.save()
+        stale.refresh_from_db()
+        self.assertEqual(stale.followers_count, 1)
+        self.assertTrue(stale.check_password('new-password'))
+
+    def test_stale_recipe_save_keeps_favorites_count(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='Текст', cooking_time=5
+        )
+        stale = Recipe.objects.get(pk=recipe.pk)
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        stale.name = 'Новый суп'
+        stale.save()
+        stale.refresh_from_db()
+        self.assertEqual(stale.favorites_count, 1)
+        self.assertEqual(stale.name, 'Новый суп')
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).recipes_count, 1
+        )